@@ -0,0 +1,127 @@
+from lib_tool import lib
+from os import path
+from datetime import datetime
+import json
+
+#
+# Assets ever recorded in walletValue.json, with the date they were first and last seen
+#   {"size": 52311, "assets": {"BTC": ["01/01/2024 10:00:01", "05/03/2024 18:00:02"], }}
+# updated by calculateWalletValue.updateWalletValueJson() with the symbols of each new record
+# so the list of assets is loaded in O(assets) instead of reading the whole history
+# size is the one of walletValue.json when the manifest was written,
+# if it doesn't match the manifest is built again from the history cache, see historyCache
+#
+class assetManifest:
+    FORMAT = '%d/%m/%Y %H:%M:%S' # same as record dates
+    BLOCK_ROWS = 10000 # records scanned at once when the manifest is built again
+
+    def __init__(self, wallet_path: str) -> None:
+        self.wallet_path = wallet_path
+        self.manifest_path = path.splitext(wallet_path)[0]+'_assets.json'
+
+    def loadFile(self) -> dict | None:
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.loads(f.read())
+            return manifest if {'size', 'assets'} <= manifest.keys() else None
+        except (OSError, json.decoder.JSONDecodeError, AttributeError):
+            return None
+
+    def dump(self, manifest: dict) -> None:
+        lib.dumpJsonAtomic(self.manifest_path, manifest)
+
+    # @return {symbol: [first seen, last seen]}
+    def load(self) -> dict[str, list[str]]:
+        manifest = self.loadFile()
+        if manifest is None or manifest['size'] != path.getsize(self.wallet_path):
+            manifest = self.build()
+        return manifest['assets']
+
+    # add symbols of a record just written in walletValue.json
+    # @param previousSize size of walletValue.json before the record was written
+    # @param mode how the record has been written, see lib.appendJson()
+    def update(self, date: str, symbols: list[str], previousSize: int, mode: str = 'append') -> None:
+        manifest = self.loadFile()
+        if manifest is None or manifest['size'] != previousSize or mode == 'rewrite':
+            self.build() # the history cache already has the new record
+            return
+
+        if mode == 'replace':
+            self.replaceLast(manifest, date, symbols)
+            return
+
+        recordDate = datetime.strptime(date, assetManifest.FORMAT)
+        assets = manifest['assets']
+        for symbol in symbols:
+            if symbol not in assets:
+                assets[symbol] = [date, date]
+                continue
+            (first, last) = assets[symbol]
+            # a record may be written before the last one, see lib.appendJson()
+            if recordDate < datetime.strptime(first, assetManifest.FORMAT): assets[symbol][0] = date
+            if recordDate > datetime.strptime(last, assetManifest.FORMAT): assets[symbol][1] = date
+        manifest['size'] = path.getsize(self.wallet_path)
+        self.dump(manifest)
+
+    # the last record, with the same date and hour of date, has been replaced
+    # symbols last seen in the replaced record and not in the new one
+    # get the date of the last record before it that has them, from the history cache
+    # symbols that were only in the replaced record are removed
+    def replaceLast(self, manifest: dict, date: str, symbols: list[str]) -> None:
+        hour = date[:13] # dd/mm/yyyy HH, one record per hour, see lib.appendJson()
+        assets = manifest['assets']
+        symbols = set(symbols)
+        stale = [symbol for (symbol, (_, last)) in assets.items() if last[:13] == hour and symbol not in symbols]
+        if len(stale) > 0:
+            from history_cache import historyCache
+            import numpy as np
+            history = historyCache(self.wallet_path).update() # the last row is the new record
+            column = {asset: i for (i, asset) in enumerate(history.assets)}
+            recordDate = history.date.astype(np.int64)
+            for symbol in stale:
+                held = np.flatnonzero(~np.isnan(history.qta[:-1, column[symbol]])) if symbol in column else []
+                if len(held) == 0: del assets[symbol]
+                else: assets[symbol][1] = assetManifest.toDate(recordDate[held[-1]])
+
+        for symbol in symbols:
+            if symbol not in assets or assets[symbol][0][:13] == hour: assets[symbol] = [date, date]
+            else: assets[symbol][1] = date
+        manifest['size'] = path.getsize(self.wallet_path)
+        self.dump(manifest)
+
+    @staticmethod
+    def toDate(seconds) -> str:
+        import numpy as np
+        return np.datetime64(int(seconds), 's').item().strftime(assetManifest.FORMAT)
+
+    # build the manifest from the history cache, a block of records at once
+    # @return the manifest
+    def build(self) -> dict:
+        from history_cache import historyCache
+        import numpy as np
+        lib.printWarn(f'Building list of assets of {self.wallet_path}...')
+        size = path.getsize(self.wallet_path)
+        history = historyCache(self.wallet_path).update()
+        date = history.date.astype(np.int64)
+        width = len(history.assets)
+        first = np.full(width, np.iinfo(np.int64).max)
+        last = np.full(width, np.iinfo(np.int64).min)
+        for start in range(0, len(history), assetManifest.BLOCK_ROWS):
+            end = start+assetManifest.BLOCK_ROWS
+            isHeld = ~np.isnan(history.qta[start:end])
+            blockDate = date[start:end, np.newaxis]
+            first = np.minimum(first, np.where(isHeld, blockDate, first).min(axis=0))
+            last = np.maximum(last, np.where(isHeld, blockDate, last).max(axis=0))
+
+        manifest = {
+            'size': size,
+            'assets': {
+                asset: [assetManifest.toDate(first[i]), assetManifest.toDate(last[i])]
+                for (i, asset) in enumerate(history.assets) if first[i] <= last[i]
+            }
+        }
+        self.dump(manifest)
+        return manifest
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+import argparse
+import random
+import json
+
+#
+# Generate a synthetic walletValue.json with the same format written by calculateWalletValue
+#   one record every hour, with random gaps of hours or days
+#   assets are held only for a part of the history, so they appear and disappear
+#   currency of records changes between EUR and USD every quarter of the history
+# symbols are "C<i>", the same listed by benchmark/mock_server.py
+# generation is deterministic, the same seed gives the same file
+#
+# usage: python benchmark/generate_history.py FILE [--records N] [--assets N] [--seed N]
+#
+START = datetime(2020, 1, 1)
+HELD_AT_ONCE = 20 # average number of assets in a record, when there are more assets than this
+
+# @return (first record, last record) each asset is held in
+def getHoldingSpans(records: int, assets: int, rng: random.Random) -> list[tuple[int, int]]:
+    spanLength = records if assets <= HELD_AT_ONCE else int(records * HELD_AT_ONCE / assets)
+    spans = []
+    for i in range(assets):
+        if i < 3: # a few assets are always held
+            spans.append((0, records))
+            continue
+        length = rng.randint(max(1, spanLength // 2), max(1, spanLength * 3 // 2))
+        start = rng.randrange(0, max(1, records - length))
+        spans.append((start, start + length))
+    return spans
+
+# write records in file
+# @return number of bytes written
+def generateHistory(file: str, records: int, assets: int, seed: int = 0) -> int:
+    rng = random.Random(seed)
+    spans = getHoldingSpans(records, assets, rng)
+    starting = dict() # record -> assets starting there
+    ending = dict()
+    for (asset, (start, end)) in enumerate(spans):
+        starting.setdefault(start, []).append(asset)
+        ending.setdefault(end, []).append(asset)
+
+    held = set()
+    date = START
+    written = 0
+    with open(file, 'w') as f:
+        lines = []
+        for record in range(records):
+            held.difference_update(ending.get(record, []))
+            held.update(starting.get(record, []))
+
+            currency = 'EUR' if (record * 4 // records) % 2 == 0 else 'USD'
+            crypto = []
+            total = 0.0
+            for asset in sorted(held):
+                qta = round(1 + (asset * 7 + record // 500) % 50 / 10, 4)
+                price = 1 + (asset % 1000) / 10 + (record % 240) / 100
+                value = round(qta * price, 2)
+                total += value
+                crypto.append(f'["C{asset}", {qta}, {value}]')
+            fiat = round(100 + record % 1000, 2)
+            crypto.append(f'["{currency}", {fiat}, {fiat}]')
+
+            lines.append(
+                f'{{"date": "{date.strftime("%d/%m/%Y %H:%M:%S")}", "total_value": {round(total+fiat, 2)}, '
+                f'"total_crypto_stable": {round(total, 2)}, "total_invested": 0, "currency": "{currency}", '
+                f'"price_provider": "coinGecko", "crypto": [["COIN, QTA, VALUE IN CURRENCY"], {", ".join(crypto)}]}}\n'
+            )
+            if len(lines) >= 10000:
+                written += f.write(''.join(lines))
+                lines = []
+
+            # next record: usually one hour later, sometimes after a gap
+            gap = rng.random()
+            if gap < 0.001: date += timedelta(days=rng.randint(1, 7))
+            elif gap < 0.02: date += timedelta(hours=rng.randint(2, 48))
+            else: date += timedelta(hours=1)
+        written += f.write(''.join(lines))
+    return written
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', help='walletValue.json to create')
+    parser.add_argument('--records', dest='records', type=int, default=10000)
+    parser.add_argument('--assets', dest='assets', type=int, default=10, help='number of different assets in the whole history')
+    parser.add_argument('--seed', dest='seed', type=int, default=0)
+    option = parser.parse_args()
+
+    size = generateHistory(option.file, option.records, option.assets, option.seed)
+    with open(option.file, 'r') as f:
+        json.loads(f.readline()) # check the format
+    print(f'{option.records} records, {option.assets} assets, {round(size/1e6, 1)} MB written in {option.file}')
+
+if __name__ == '__main__':
+    main()
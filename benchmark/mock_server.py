@@ -0,0 +1,146 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from threading import Thread, Lock
+from time import sleep
+import argparse
+import json
+
+#
+# Local mock of the endpoints used by the price providers
+#   CoinGecko      /api/v3/coins/list, /api/v3/simple/price
+#   CoinMarketCap  /v1/key/info, /v1/cryptocurrency/map, /v1/cryptocurrency/quotes/latest
+#   Yahoo          /v8/finance/chart/<symbol> (last price, or daily closes with period1 and period2)
+# there are `coins` coins: CoinGecko id "coin-<i>" symbol "c<i>", CoinMarketCap id <i> symbol "C<i>"
+# a CoinGecko price request with a malformed id eg. "coin-x" is rejected with 400
+# prices are deterministic, so runs can be compared
+# latency is added to every response, to emulate a real network
+#
+# usage: python benchmark/mock_server.py [--port PORT] [--coins N] [--latency SECONDS]
+#
+def getPrice(i: int) -> float:
+    return round(1 + (i % 1000) / 10, 2)
+
+class mockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, like real providers
+    disable_nagle_algorithm = True # headers and body are written separately, don't delay the body
+
+    # called once for each connection, requests on a kept-alive connection don't call it again
+    def setup(self) -> None:
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self) -> None:
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency > 0: sleep(server.latency)
+
+        url = urlsplit(self.path)
+        query = {key: values[0] for (key, values) in parse_qs(url.query).items()}
+        coins = server.coins
+
+        if url.path == '/api/v3/coins/list':
+            body = [{'id': f'coin-{i}', 'symbol': f'c{i}', 'name': f'Coin {i}'} for i in range(coins)]
+        elif url.path == '/api/v3/simple/price':
+            currency = query.get('vs_currencies', 'eur')
+            ids = query.get('ids', '').split(',')
+            if any(id.startswith('coin-') and not id[5:].isdigit() for id in ids):
+                # malformed id eg. "coin-x", the whole request is rejected
+                self.sendJson(400, {'error': 'invalid id'})
+                return
+            body = {id: {currency: getPrice(int(id[5:]))} for id in ids if id.startswith('coin-')}
+        elif url.path == '/v1/key/info':
+            body = {'data': {'plan': {'credit_limit_monthly': 10000}}}
+        elif url.path == '/v1/cryptocurrency/map':
+            body = {
+                'status': {'error_code': 0},
+                'data': [{'id': i, 'symbol': f'C{i}', 'name': f'Coin {i}', 'rank': i+1, 'is_active': 1} for i in range(coins)]
+            }
+        elif url.path == '/v1/cryptocurrency/quotes/latest':
+            currency = query.get('convert', 'EUR')
+            body = {'data': {
+                id: {'quote': {currency: {'price': getPrice(int(id))}}}
+                for id in query.get('id', '').split(',') if id.isdigit()
+            }}
+        elif url.path.startswith('/v8/finance/chart/'):
+            if 'period1' in query:
+                timestamps = list(range(int(query['period1']), int(query['period2']), 86400))
+                result = {
+                    'timestamp': timestamps,
+                    'indicators': {'quote': [{'close': [1.05 + (ts // 86400 % 30) / 1000 for ts in timestamps]}]}
+                }
+            else:
+                result = {'meta': {'regularMarketPrice': 1.08}}
+            body = {'chart': {'result': [result]}}
+        else:
+            self.sendJson(404, {'error': 'not found'})
+            return
+        self.sendJson(200, body)
+
+    def sendJson(self, status: int, body) -> None:
+        data = json.dumps(body, separators=(',', ':')).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+class mockServer:
+    def __init__(self, coins: int = 1000, latency: float = 0, port: int = 0) -> None:
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), mockHandler)
+        self.server.daemon_threads = True
+        self.server.coins = coins
+        self.server.latency = latency
+        self.server.requests = 0
+        self.server.connections = 0
+        self.server.lock = Lock()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # base urls to replace the real ones, see patchProviders()
+    def getBaseUrls(self) -> dict[str, str]:
+        return {'cg': self.url+'api/v3/', 'cmc': self.url+'v1/', 'yahoo': self.url}
+
+    # number of requests received
+    @property
+    def requests(self) -> int:
+        return self.server.requests
+
+    # number of connections opened by clients
+    @property
+    def connections(self) -> int:
+        return self.server.connections
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+# make new_api send all requests to the mock server
+def patchProviders(baseUrls: dict[str, str]) -> None:
+    import new_api
+    new_api.cg_api_n.BASEURL = baseUrls['cg']
+    new_api.cmc_api.BASEURL = baseUrls['cmc']
+    new_api.YAHOO_BASEURL = baseUrls['yahoo']
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', dest='port', type=int, default=8000)
+    parser.add_argument('--coins', dest='coins', type=int, default=1000, help='number of coins listed')
+    parser.add_argument('--latency', dest='latency', type=float, default=0, help='seconds added to every response')
+    option = parser.parse_args()
+
+    server = mockServer(option.coins, option.latency, option.port)
+    print(f'Mock server listening on {server.url}, ^C to stop')
+    for (provider, url) in server.getBaseUrls().items():
+        print(f'\t{provider:<6} {url}')
+    try:
+        while True: sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+from os import path, mkdir
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import subprocess
+import argparse
+import shutil
+import json
+import sys
+
+#
+# Measure cold start time of main.py, every run is a new python process
+#   --version           until the process exit
+#   --calc --crypto     until the first network call (dns lookup or connect)
+#   --report --total    until the first user input is asked
+# network and user input are replaced by a function that stop the run,
+# so nothing leaves the machine and no one has to type anything
+# it also shows which heavy modules were imported when the run stopped
+# "python" is the start time of an empty interpreter, as reference
+#
+# usage: python benchmark/startup.py [-n RUNS] [--json FILE]
+#
+REPO = path.dirname(path.dirname(path.abspath(__file__)))
+HEAVY_MODULES = ['requests', 'numpy', 'pandas', 'matplotlib', 'seaborn', 'yfinance']
+COMMANDS = {
+    'python': None,
+    '--version': ['--version'],
+    '--calc': ['--calc', '--crypto'],
+    '--report': ['--report', '--total'],
+}
+
+RUNNER = '''
+import sys, json, socket, builtins, runpy
+class StopRun(BaseException): pass # not catched by "except Exception"
+def stopRun(*args, **kwargs): raise StopRun()
+socket.getaddrinfo = stopRun
+socket.socket.connect = stopRun
+builtins.input = stopRun
+
+sys.path.insert(0, {repo!r})
+sys.argv = ['main.py'] + {args!r}
+try:
+    runpy.run_path({main!r}, run_name='__main__')
+except (StopRun, SystemExit):
+    pass
+print(json.dumps([m for m in {heavy!r} if m in sys.modules]))
+'''
+
+# create settings, input and a short history in workdir
+def prepareWorkdir(workdir: str) -> None:
+    dataPath = path.join(workdir, 'data')
+    mkdir(dataPath)
+    shutil.copy(path.join(REPO, 'config.json'), workdir)
+    with open(path.join(workdir, 'settings.json'), 'w') as f:
+        f.write(json.dumps({
+            'currency': 'EUR', 'provider': 'cg', 'fetchSymb': False, 'CMC_key': '',
+            'path': dataPath, 'save_img': False, 'minimumPieSlice': 0.02
+        }))
+    with open(path.join(workdir, 'input.csv'), 'w') as f:
+        f.write('symbol,qta,label\nBTC,0.1,\nETH,2,\nEUR,100,\n')
+    with open(path.join(dataPath, 'walletValue.json'), 'w') as f:
+        for hour in range(3):
+            f.write(json.dumps({
+                'date': f'01/01/2024 0{hour}:00:00', 'total_value': 100+hour, 'total_crypto_stable': 90+hour,
+                'total_invested': 0, 'currency': 'EUR', 'price_provider': 'coinGecko',
+                'crypto': [['COIN, QTA, VALUE IN CURRENCY'], ['BTC', 0.1, 90+hour], ['EUR', 10, 10]]
+            })+'\n')
+
+# run main.py with args in a new process, an empty interpreter if args is None
+# @return (wall time in seconds, list of heavy modules imported)
+def measure(args: list[str] | None, workdir: str) -> tuple[float, list[str]]:
+    if args is None:
+        code = 'print("[]")'
+    else:
+        code = RUNNER.format(repo=REPO, args=args, main=path.join(REPO, 'main.py'), heavy=HEAVY_MODULES)
+    start = perf_counter()
+    res = subprocess.run([sys.executable, '-c', code], cwd=workdir, capture_output=True, text=True)
+    elapsed = perf_counter() - start
+    try:
+        imported = json.loads(res.stdout.strip().splitlines()[-1])
+    except (IndexError, json.decoder.JSONDecodeError):
+        print(res.stdout, res.stderr, file=sys.stderr)
+        raise RuntimeError(f'{" ".join(args or ["python"])} failed')
+    return elapsed, imported
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', dest='runs', type=int, default=5, help='number of runs of each command')
+    parser.add_argument('--json', dest='json', default='', help='save results in this file')
+    option = parser.parse_args()
+
+    results = dict()
+    with TemporaryDirectory() as workdir:
+        prepareWorkdir(workdir)
+        for (name, args) in COMMANDS.items():
+            times = []
+            for _ in range(option.runs):
+                elapsed, imported = measure(args, workdir)
+                times.append(elapsed)
+            results[name] = {
+                'median_ms': round(median(times)*1000, 1),
+                'min_ms': round(min(times)*1000, 1),
+                'imported': imported,
+            }
+            print(f'{name:<10} median {results[name]["median_ms"]:>8} ms  min {results[name]["min_ms"]:>8} ms  imported: {", ".join(imported) or "-"}')
+
+    if option.json:
+        with open(option.json, 'w') as f:
+            f.write(json.dumps({'python': sys.version.split()[0], 'runs': option.runs, 'results': results}, indent=4))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+from os import path, mkdir, chdir, getcwd, environ
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import subprocess
+import argparse
+import shutil
+import json
+import sys
+
+REPO = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, REPO)
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+from generate_history import generateHistory
+from mock_server import mockServer, patchProviders
+
+#
+# Benchmark suite of the hot paths, on synthetic histories and a local mock price server
+#   lib.updateJson              rewrite of a record in the middle of the history
+#   lib.appendJson              overwrite of the last record
+#   loadDatetime                --report --total, cold (history cache rebuilt) and warm
+#   retrieveCryptoList          --report --singleCrypto, assets and their dates from the manifest
+#   loadMatrix                  --report --singleCrypto, amount and value of all assets
+#   selectData                  --report --singleCrypto, data of one asset from the matrix
+#   convertSymbol2ID            CoinGecko symbols to ids, without cached conversions
+#   getPriceOf                  CoinGecko and CoinMarketCap prices of all assets
+#   --calc --total              full run of main.py in a new process, with its --profile trace
+# histories have one record every hour with gaps, currency changes and assets coming and going,
+# see generate_history.py; all requests go to the mock server, see mock_server.py
+# the full run needs matplotlib and seaborn, if it fails the error is reported and the suite goes on
+#
+# usage: python benchmark/suite.py [--sizes N ...] [--assets N ...] [--repeat N] [--json FILE] [--compare OLD.json]
+#   eg. --sizes 10000 100000 1000000 --assets 10 500
+#
+COINS = 5000 # coins listed by the mock server
+REGRESSION = 1.10 # slower than this ratio is flagged by --compare
+CMC_KEY = '00000000-0000-0000-0000-000000000000' # any 36 characters key is accepted by the mock server
+
+RUNNER = '''
+import sys, runpy
+sys.path.insert(0, {repo!r})
+sys.path.insert(0, {bench!r})
+from mock_server import patchProviders
+patchProviders({baseUrls!r})
+sys.argv = ['main.py'] + {args!r}
+runpy.run_path({main!r}, run_name='__main__')
+'''
+
+# create settings, config, input and the history of records in workdir
+def prepareWorkdir(workdir: str, records: int, assets: int) -> str:
+    dataPath = path.join(workdir, 'data')
+    mkdir(dataPath)
+    shutil.copy(path.join(REPO, 'config.json'), workdir)
+    with open(path.join(workdir, 'settings.json'), 'w') as f:
+        f.write(json.dumps({
+            'currency': 'EUR', 'provider': 'cg', 'fetchSymb': False, 'CMC_key': CMC_KEY,
+            'path': dataPath, 'save_img': False, 'minimumPieSlice': 0.02,
+            'request_timeout': 15, 'quote_ttl': 0, 'quote_cache_size': 2000,
+            'daemon_interval': 3600, 'id_refresh_interval': 3600,
+            'rate_limits': {'cg': 100000, 'cmc': 100000, 'yahoo': 100000}
+        }))
+    with open(path.join(workdir, 'input.csv'), 'w') as f:
+        f.write('symbol,qta,label\n' + ''.join(f'C{i},{1+i%10},\n' for i in range(assets)) + 'EUR,100,\n')
+    wallet_path = path.join(dataPath, 'walletValue.json')
+    generateHistory(wallet_path, records, assets)
+    return wallet_path
+
+# @return median and min wall time of fn in seconds, setup is called before each run and not timed
+def measure(fn, repeat: int, setup = None) -> dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        if setup is not None: setup()
+        start = perf_counter()
+        fn()
+        times.append(perf_counter() - start)
+    return {'median_ms': round(median(times)*1000, 2), 'min_ms': round(min(times)*1000, 2)}
+
+# benchmarks that read or write the history
+def benchHistory(wallet_path: str, repeat: int) -> dict[str, dict]:
+    from lib_tool import lib
+    from main import walletBalanceReport, cryptoBalanceReport
+    results = dict()
+
+    with open(wallet_path, 'r') as f:
+        lines = f.readlines()
+    middle = lines[len(lines)//2].rstrip('\n')
+    last = lines[-1].rstrip('\n')
+    del lines
+    middleDate = json.loads(middle)['date']
+    lastDate = json.loads(last)['date']
+
+    # the same record is written again, so the file never changes between runs
+    results['updateJson'] = measure(lambda: lib.updateJson(wallet_path, middleDate, middle), repeat)
+    lib.appendJson(wallet_path, lastDate, last) # build the index of the last record
+    results['appendJson'] = measure(lambda: lib.appendJson(wallet_path, lastDate, last), repeat)
+
+    report = walletBalanceReport('total')
+    cacheDir = path.splitext(wallet_path)[0]+'_cache'
+    clearCache = lambda: shutil.rmtree(cacheDir, ignore_errors=True)
+    results['loadDatetime_cold'] = measure(report.loadDatetime, repeat, clearCache)
+    results['loadDatetime_warm'] = measure(report.loadDatetime, repeat)
+
+    report = cryptoBalanceReport()
+    report.retrieveCryptoList() # build the manifest
+    results['retrieveCryptoList'] = measure(report.retrieveCryptoList, repeat)
+    results['loadMatrix'] = measure(report.loadMatrix, repeat)
+    report.ticker = report.cryptos[:1]
+    results['selectData'] = measure(report.selectData, repeat)
+    return results
+
+# benchmarks of price providers, requests are served by the mock server
+def benchProviders(assets: int, repeat: int) -> dict[str, dict]:
+    import new_api
+    results = dict()
+    symbols = [f'C{i}' for i in range(assets)]
+
+    def newCG():
+        with open('cached_id_CG.json', 'w') as f:
+            f.write(json.dumps({'fixed': [], 'used': {}}))
+        return new_api.cg_api_n('EUR')
+
+    cg = newCG() # download the coin list once
+    def resetCG():
+        nonlocal cg
+        cg = newCG()
+    results['convertSymbol2ID'] = measure(lambda: cg.convertSymbol2ID(symbols), repeat, resetCG)
+    results['getPriceOf_cg'] = measure(lambda: cg.getPriceOf(symbols), repeat)
+
+    cmc = new_api.cmc_api('EUR', CMC_KEY)
+    results['getPriceOf_cmc'] = measure(lambda: cmc.getPriceOf(symbols), repeat)
+    new_api.flushIdCaches() # before workdir is deleted
+    return results
+
+# run main.py with args in a new process, repeat times
+# @return wall time and stage totals of the --profile trace of the last run
+def benchRun(args: list[str], baseUrls: dict[str, str], workdir: str, repeat: int) -> dict:
+    trace = path.join(workdir, 'profile.json')
+    code = RUNNER.format(
+        repo=REPO, bench=path.dirname(path.abspath(__file__)), baseUrls=baseUrls,
+        args=args+['--profile', trace], main=path.join(REPO, 'main.py')
+    )
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        res = subprocess.run(
+            [sys.executable, '-c', code], cwd=workdir, capture_output=True, text=True,
+            stdin=subprocess.DEVNULL, env=dict(environ, MPLBACKEND='Agg')
+        )
+        times.append(perf_counter() - start)
+        if res.returncode != 0 or not path.exists(trace):
+            error = (res.stderr.strip().splitlines() or ['no profile trace written'])[-1]
+            return {'error': error}
+    with open(trace, 'r') as f:
+        stages = json.loads(f.read())['stage_totals']
+    return {
+        'median_ms': round(median(times)*1000, 2), 'min_ms': round(min(times)*1000, 2),
+        'stages_ms': {name: round(s['total_s']*1000, 2) for (name, s) in stages.items()}
+    }
+
+def runCase(records: int, assets: int, repeat: int, server: mockServer) -> dict[str, dict]:
+    cwd = getcwd()
+    with TemporaryDirectory() as workdir:
+        wallet_path = prepareWorkdir(workdir, records, assets)
+        chdir(workdir)
+        try:
+            results = benchHistory(wallet_path, repeat)
+            results.update(benchProviders(assets, repeat))
+            results['calc_total'] = benchRun(['--calc', '--total'], server.getBaseUrls(), workdir, repeat)
+        finally:
+            chdir(cwd)
+    return results
+
+def printResults(case: str, results: dict[str, dict], old: dict | None) -> None:
+    print(f'\n{case}')
+    for (name, res) in results.items():
+        if 'error' in res:
+            print(f'  {name:<22} failed: {res["error"]}')
+            continue
+        line = f'  {name:<22} median {res["median_ms"]:>10} ms'
+        if 'min_ms' in res: line += f'  min {res["min_ms"]:>10} ms'
+        oldRes = (old or {}).get(case, {}).get(name, {})
+        if oldRes.get('median_ms'):
+            ratio = res['median_ms'] / oldRes['median_ms']
+            line += f'  x{ratio:.2f}' + ('  REGRESSION' if ratio > REGRESSION else '')
+        print(line)
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', dest='sizes', type=int, nargs='+', default=[10000, 100000], help='number of hourly records of each history')
+    parser.add_argument('--assets', dest='assets', type=int, nargs='+', default=[10, 100], help='number of different assets of each history')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3, help='number of runs of each benchmark')
+    parser.add_argument('--json', dest='json', default='', help='save results in this file')
+    parser.add_argument('--compare', dest='compare', default='', help='compare with results saved by a previous run')
+    option = parser.parse_args()
+
+    old = None
+    if option.compare:
+        with open(option.compare, 'r') as f:
+            old = json.loads(f.read())['results']
+
+    # patched for benchmarks run in this process, full runs are patched by RUNNER
+    server = mockServer(COINS)
+    patchProviders(server.getBaseUrls())
+    results = dict()
+    try:
+        for records in option.sizes:
+            for assets in option.assets:
+                case = f'{records} records, {assets} assets'
+                results[case] = runCase(records, assets, option.repeat, server)
+                printResults(case, results[case], old)
+    finally:
+        server.stop()
+
+    if option.json:
+        with open(option.json, 'w') as f:
+            f.write(json.dumps({'python': sys.version.split()[0], 'repeat': option.repeat, 'coins': COINS, 'results': results}, indent=4))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+from lib_tool import lib
+from profiler import profiler
+from os import path, mkdir, remove
+from datetime import datetime
+import numpy as np
+import json
+
+#
+# Columnar cache of walletValue.json
+# every field used by the reports is stored in a raw binary file,
+# one row per record, and it's memory-mapped when loaded
+#   date.bin                int64   seconds since epoch (datetime64[s])
+#   total_value.bin         float64
+#   total_crypto_stable.bin float64 NaN when missing in the record
+#   currency.bin            int16   index of meta['currencies']
+#   qta.bin, value.bin      float64 matrix records x assets, NaN when asset is not in the record
+# meta.json keeps shape of the files and position of the last parsed record
+# so when new records are appended only the new lines are parsed
+#
+class historyCache:
+    VERSION = 1
+    COLUMNS = {
+        'date': np.int64,
+        'total_value': np.float64,
+        'total_crypto_stable': np.float64,
+        'currency': np.int16,
+    }
+    MATRIX = ['qta', 'value']
+
+    def __init__(self, wallet_path: str) -> None:
+        self.wallet_path = wallet_path
+        self.cache_dir = path.splitext(wallet_path)[0]+'_cache'
+        self.meta_path = path.join(self.cache_dir, 'meta.json')
+        self.meta = self.emptyMeta()
+
+    def __len__(self) -> int:
+        return self.meta['length']
+
+    @staticmethod
+    def emptyMeta() -> dict:
+        return {
+            'version': historyCache.VERSION,
+            'length': 0,
+            'assets': [],
+            'currencies': [],
+            'parsed_bytes': 0,
+            # offset and content of the last 2 records
+            # used to detect if the history file has been modified
+            'prev_offset': 0, 'prev_line': '',
+            'last_offset': 0, 'last_line': '',
+        }
+
+    def filePath(self, name: str) -> str:
+        return path.join(self.cache_dir, name+'.bin')
+
+    def loadMeta(self) -> dict | None:
+        try:
+            with open(self.meta_path, 'r') as f:
+                meta = json.loads(f.read())
+            return meta if meta.get('version') == historyCache.VERSION else None
+        except (OSError, json.decoder.JSONDecodeError):
+            return None
+
+    # read bytes between start and end of the history file
+    def readBytes(self, start: int, end: int) -> bytes:
+        with open(self.wallet_path, 'rb') as f:
+            f.seek(start)
+            return f.read(end-start)
+
+    # bring the cache up to date with the history file and load it
+    # only records added since the last update are parsed,
+    # the whole file is parsed only if it has been modified in the middle
+    def update(self) -> 'historyCache':
+        if not path.isdir(self.cache_dir): mkdir(self.cache_dir)
+        meta = self.loadMeta()
+        size = path.getsize(self.wallet_path)
+
+        isUpToDate = False
+        if meta is None or size < meta['last_offset']:
+            meta, start = self.emptyMeta(), 0
+        elif size >= meta['parsed_bytes'] and \
+                self.readBytes(meta['last_offset'], meta['parsed_bytes']) == meta['last_line'].encode():
+            # new records may have been appended
+            start = meta['parsed_bytes']
+            isUpToDate = start == size
+        elif meta['length'] > 0 and \
+                self.readBytes(meta['prev_offset'], meta['last_offset']) == meta['prev_line'].encode():
+            # the last record has been replaced, see lib.appendJson()
+            meta['length'] -= 1
+            meta['parsed_bytes'] = meta['last_offset']
+            meta['last_offset'], meta['last_line'] = meta['prev_offset'], meta['prev_line']
+            start = meta['parsed_bytes']
+        else: # modified in the middle
+            meta, start = self.emptyMeta(), 0
+
+        self.meta = meta
+        if not isUpToDate:
+            # if the update is interrupted, missing meta.json will force a full parse next time
+            if path.exists(self.meta_path): remove(self.meta_path)
+            self.truncate(meta['length'], len(meta['assets']))
+            self.appendRecords(self.readBytes(start, size), start)
+        return self.load()
+
+    # cut binary files to length rows
+    def truncate(self, length: int, width: int) -> None:
+        for name, dtype in historyCache.COLUMNS.items():
+            self.truncateFile(self.filePath(name), length*np.dtype(dtype).itemsize)
+        for name in historyCache.MATRIX:
+            self.truncateFile(self.filePath(name), length*width*np.dtype(np.float64).itemsize)
+
+    @staticmethod
+    def truncateFile(file: str, size: int) -> None:
+        if size == 0 or not path.exists(file):
+            open(file, 'wb').close()
+            return
+        with open(file, 'r+b') as f:
+            f.truncate(size)
+
+    # parse json lines in data and append them to binary files
+    # @param data bytes read from the history file
+    # @param offset position of data in the history file
+    def appendRecords(self, data: bytes, offset: int) -> None:
+        meta = self.meta
+        assetIndex = {asset: i for (i, asset) in enumerate(meta['assets'])}
+        currencyIndex = {cur: i for (i, cur) in enumerate(meta['currencies'])}
+        columns = {name: [] for name in historyCache.COLUMNS}
+        rows = [] # list of [(asset index, qta, value), ]
+
+        for line in data.splitlines(keepends=True):
+            lineOffset = offset
+            offset += len(line)
+            if line.strip() == b'': continue
+            try:
+                record = json.loads(line)
+                date = datetime.strptime(record['date'], '%d/%m/%Y %H:%M:%S')
+            except (json.decoder.JSONDecodeError, KeyError, ValueError) as e:
+                lib.printFail(f'Json error, {self.wallet_path=} {e}')
+                continue
+
+            if record['currency'] not in currencyIndex:
+                currencyIndex[record['currency']] = len(meta['currencies'])
+                meta['currencies'].append(record['currency'])
+
+            row = []
+            for (symbol, qta, value, *_) in record['crypto'][1:]: # skip the first element, it's ["COIN, QTA, VALUE IN CURRENCY"]
+                if symbol not in assetIndex:
+                    assetIndex[symbol] = len(meta['assets'])
+                    meta['assets'].append(symbol)
+                row.append((assetIndex[symbol], qta, value))
+
+            columns['date'].append(np.datetime64(date, 's').astype(np.int64))
+            columns['total_value'].append(record.get('total_value', np.nan))
+            columns['total_crypto_stable'].append(record.get('total_crypto_stable', np.nan))
+            columns['currency'].append(currencyIndex[record['currency']])
+            rows.append(row)
+
+            meta['prev_offset'], meta['prev_line'] = meta['last_offset'], meta['last_line']
+            meta['last_offset'], meta['last_line'] = lineOffset, line.decode()
+        meta['parsed_bytes'] = offset
+
+        for name, dtype in historyCache.COLUMNS.items():
+            with open(self.filePath(name), 'ab') as f:
+                np.array(columns[name], dtype=dtype).tofile(f)
+
+        # previous rows need a new column for each new asset
+        oldWidth = self.loadedWidth()
+        width = len(meta['assets'])
+        for (i, name) in enumerate(historyCache.MATRIX):
+            if width != oldWidth and meta['length'] > 0:
+                old = np.fromfile(self.filePath(name), dtype=np.float64).reshape(meta['length'], oldWidth)
+                resized = np.full((meta['length'], width), np.nan)
+                resized[:, :oldWidth] = old
+                resized.tofile(self.filePath(name))
+
+            new = np.full((len(rows), width), np.nan)
+            for (r, row) in enumerate(rows):
+                for item in row:
+                    new[r, item[0]] = item[i+1]
+            with open(self.filePath(name), 'ab') as f:
+                new.tofile(f)
+
+        meta['length'] += len(rows)
+        profiler.count('history.records_parsed', len(rows))
+        lib.dumpCompactJson(self.meta_path, meta) # written last, see update()
+
+    # number of assets of the matrix files currently on disk
+    def loadedWidth(self) -> int:
+        if self.meta['length'] == 0: return 0
+        return path.getsize(self.filePath('qta')) // (self.meta['length']*np.dtype(np.float64).itemsize)
+
+    # memory-map binary files, data is read from disk only when it's accessed
+    def load(self) -> 'historyCache':
+        length = self.meta['length']
+        width = len(self.meta['assets'])
+        for name, dtype in historyCache.COLUMNS.items():
+            setattr(self, name, self.mapFile(name, dtype, (length, )))
+        for name in historyCache.MATRIX:
+            setattr(self, name, self.mapFile(name, np.float64, (length, width)))
+
+        self.date = self.date.view('datetime64[s]')
+        self.assets = self.meta['assets']
+        self.currencies = self.meta['currencies']
+        return self
+
+    def mapFile(self, name: str, dtype, shape: tuple) -> np.ndarray:
+        if 0 in shape: # empty files can't be memory-mapped
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self.filePath(name), dtype=dtype, mode='r', shape=shape)
+
+    # build a regular grid of dates, one every unit, from the first to the last date 
+    # and forward-fill values on it, missing slots get the value of the last record before them
+    # records don't need to be sorted, when more records fall in the same slot the last one wins
+    # @param date datetime64 array
+    # @param values array with one row per record, 1d or 2d (records x assets)
+    # @param unit 'h' for an hourly grid, 'D' for a daily grid
+    # @return (grid, values on grid), grid is a datetime64 array
+    @staticmethod
+    def resample(date: np.ndarray, values: np.ndarray, unit: str = 'h') -> tuple[np.ndarray, np.ndarray]:
+        slot = np.asarray(date).astype(f'datetime64[{unit}]')
+        values = np.asarray(values)
+        if len(slot) == 0:
+            return slot, values[:0]
+
+        order = np.argsort(slot, kind='stable') # stable keeps file order of records in the same slot
+        slot, values = slot[order], values[order]
+        isLastOfSlot = np.append(slot[1:] != slot[:-1], True)
+        slot, values = slot[isLastOfSlot], values[isLastOfSlot]
+
+        grid = np.arange(slot[0], slot[-1]+1)
+        # index of the last record at or before each slot of grid
+        return grid, values[np.searchsorted(slot, grid, side='right')-1]
+
+    # delete all cache files, next update() will parse the whole history
+    def clear(self) -> None:
+        for name in [*historyCache.COLUMNS, *historyCache.MATRIX]:
+            if path.exists(self.filePath(name)): remove(self.filePath(name))
+        if path.exists(self.meta_path): remove(self.meta_path)
+        self.meta = self.emptyMeta()
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,181 @@
+from lib_tool import lib
+from profiler import profiler
+from os import path
+import io
+import json
+
+#
+# Holdings derived from a ledger of transactions, instead of final balances in input.csv
+# ledger is a csv with header, one transaction per row, new transactions are appended at the end
+#   date,type,symbol,qta,quote,quote_qta,fee,fee_symbol
+#   2024-01-02,buy,BTC,0.1,EUR,4000,2,EUR        +0.1 BTC  -4000 EUR  -2 EUR
+#   2024-01-05,sell,BTC,0.05,EUR,2100,,          -0.05 BTC +2100 EUR
+#   2024-01-06,deposit,EUR,500,,,,               +500 EUR (transfer in)
+#   2024-01-07,withdraw,ETH,1,,,0.001,ETH        -1 ETH (transfer out) -0.001 ETH
+#   2024-01-08,transfer,ETH,2,,,0.002,           between your own wallets, only the fee counts
+#   2024-01-09,fee,ETH,0.01,,,,                  -0.01 ETH
+# only type, symbol and qta are required, fee_symbol is symbol when it's empty
+# holdings are saved in a checkpoint file with the byte offset of the last transaction replayed
+# so each run replays only transactions appended since then
+# ledger is append-only, if the last transaction replayed is no longer at the same offset
+# (eg. rows have been inserted or deleted) all transactions are replayed
+# to replay them after editing a row in place, delete the .checkpoint file
+#
+class ledger:
+    VERSION = 1
+    CHUNK_ROWS = 100000
+    REQUIRED = ['type', 'symbol', 'qta']
+    SIGN = {'buy': 1, 'sell': -1, 'deposit': 1, 'withdraw': -1, 'transfer': 0, 'fee': -1}
+    QUOTE_SIGN = {'buy': -1, 'sell': 1} # quote is paid when buying and received when selling
+    ZERO = 1e-12 # smaller holdings are rounding errors of sold out assets
+
+    def __init__(self, file: str) -> None:
+        self.file = file
+        self.checkpoint_path = file+'.checkpoint'
+
+    @staticmethod
+    def emptyCheckpoint() -> dict:
+        return {
+            'version': ledger.VERSION,
+            'columns': [],
+            'offset': 0, # bytes replayed
+            'last_line': '', # last transaction replayed, to detect if the ledger has been modified
+            'rows': 0,
+            'bad_rows': 0,
+            'holdings': dict(),
+        }
+
+    def loadCheckpoint(self) -> dict | None:
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.loads(f.read())
+            return checkpoint if checkpoint.get('version') == ledger.VERSION else None
+        except (OSError, json.decoder.JSONDecodeError, AttributeError):
+            return None
+
+    def dumpCheckpoint(self, checkpoint: dict) -> None:
+        lib.dumpJsonAtomic(self.checkpoint_path, checkpoint)
+
+    # @return True if the ledger still contains checkpoint['last_line'] just before checkpoint['offset']
+    def isCheckpointValid(self, checkpoint: dict, size: int) -> bool:
+        last_line = checkpoint['last_line'].encode()
+        start = checkpoint['offset']-len(last_line)
+        if checkpoint['offset'] > size or start < 0: return False
+        with open(self.file, 'rb') as f:
+            f.seek(start)
+            return f.read(len(last_line)) == last_line
+
+    # replay transactions appended since the last checkpoint and save a new one
+    # @return holdings eg. {'BTC': 0.05, 'EUR': 4598.0}
+    def update(self) -> dict[str, float]:
+        if not path.exists(self.file):
+            lib.printFail(f'Ledger {self.file} not found')
+            exit()
+        size = path.getsize(self.file)
+        checkpoint = self.loadCheckpoint()
+        if checkpoint is None or not self.isCheckpointValid(checkpoint, size):
+            if checkpoint is not None:
+                lib.printWarn(f'{self.file} has been modified, replaying all transactions...')
+            checkpoint = self.emptyCheckpoint()
+
+        with open(self.file, 'rb') as f:
+            end = self.getLastNewLine(f, size) # an unfinished last line is left for the next run
+            if checkpoint['offset'] == 0:
+                f.seek(0)
+                header = f.readline()
+                checkpoint['columns'] = [name.strip().lower() for name in header.decode().split(',')]
+                checkpoint['offset'] = f.tell()
+                checkpoint['last_line'] = header.decode()
+                missing = set(ledger.REQUIRED) - set(checkpoint['columns'])
+                if missing:
+                    lib.printFail(f'Ledger {self.file} needs {sorted(missing)} columns')
+                    exit()
+            if end > checkpoint['offset']:
+                f.seek(checkpoint['offset'])
+                rows, badRows = self.replay(io.BufferedReader(rangeReader(f, end)), checkpoint)
+                lib.printOk(f'{rows} new transaction(s) replayed from {self.file}')
+                if badRows > 0:
+                    lib.printFail(f'{badRows} transaction(s) of {self.file} skipped, type, symbol or qta missing or not valid')
+
+                start = self.getLastNewLine(f, end-1) # start of the last line
+                f.seek(start)
+                checkpoint['last_line'] = f.read(end-start).decode()
+                checkpoint['offset'] = end
+        self.dumpCheckpoint(checkpoint)
+        return {symbol: qta for (symbol, qta) in checkpoint['holdings'].items() if abs(qta) > ledger.ZERO}
+
+    # @return offset after the last new line of f, 0 if there isn't any
+    @staticmethod
+    def getLastNewLine(f, size: int, block: int = 8192) -> int:
+        end = size
+        while end > 0:
+            start = max(0, end-block)
+            f.seek(start)
+            i = f.read(end-start).rfind(b'\n')
+            if i >= 0: return start+i+1
+            end = start
+        return 0
+
+    # add quantities moved by each transaction to checkpoint['holdings'], a chunk of rows at once
+    # @return (rows replayed, rows skipped)
+    def replay(self, f, checkpoint: dict) -> tuple[int, int]:
+        from pandas import read_csv, to_numeric, concat, Series
+        holdings = checkpoint['holdings']
+        rows, badRows = 0, 0
+        for chunk in read_csv(f, header=None, names=checkpoint['columns'], dtype=str, chunksize=ledger.CHUNK_ROWS):
+            rows += len(chunk)
+            empty = Series(index=chunk.index, dtype=str)
+            kind = chunk['type'].str.strip().str.lower()
+            symbol = chunk['symbol'].str.strip().str.upper()
+            qta = to_numeric(chunk['qta'], errors='coerce')
+            quote = chunk.get('quote', empty).str.strip().str.upper()
+            quoteQta = to_numeric(chunk.get('quote_qta', empty), errors='coerce')
+            fee = to_numeric(chunk.get('fee', empty), errors='coerce')
+            feeSymbol = chunk.get('fee_symbol', empty).str.strip().str.upper().fillna(symbol)
+            sign = kind.map(ledger.SIGN)
+            quoteSign = kind.map(ledger.QUOTE_SIGN).fillna(0)
+
+            hasQuote = quote.notna() & (quote != '')
+            hasFee = chunk.get('fee', empty).notna()
+            isBad = sign.isna() | symbol.isna() | (symbol == '') | qta.isna() \
+                | (hasQuote & quoteQta.isna()) | (hasFee & fee.isna())
+            badRows += int(isBad.sum())
+
+            # every transaction moves up to 3 quantities: symbol, quote and fee
+            isQuote = ~isBad & hasQuote & (quoteSign != 0)
+            isFee = ~isBad & hasFee
+            moved = concat([
+                Series((qta*sign)[~isBad].values, index=symbol[~isBad].values),
+                Series((quoteQta*quoteSign)[isQuote].values, index=quote[isQuote].values),
+                Series(-fee[isFee].values, index=feeSymbol[isFee].values),
+            ])
+            for (sym, q) in moved.groupby(level=0, sort=False).sum().items():
+                holdings[sym] = holdings.get(sym, 0.0) + float(q)
+
+        checkpoint['rows'] += rows
+        checkpoint['bad_rows'] += badRows
+        profiler.count('ledger.rows', rows)
+        profiler.count('ledger.bad_rows', badRows)
+        return rows, badRows
+
+#
+# Read only the bytes of f before end
+# so read_csv doesn't parse an unfinished last line
+#
+class rangeReader(io.RawIOBase):
+    def __init__(self, f, end: int) -> None:
+        self.f = f
+        self.end = end
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = min(len(buffer), self.end-self.f.tell())
+        if n <= 0: return 0
+        data = self.f.read(n)
+        buffer[:len(data)] = data
+        return len(data)
+
+if __name__ == '__main__':
+    pass
@@ -1,10 +1,14 @@
-from json import load, loads, decoder, dumps
+from json import load, loads, decoder, dumps, JSONDecoder, JSONEncoder
 from datetime import datetime, timedelta
 from os import environ, path, getcwd, mkdir
-from platform import system
-from pandas import DataFrame
-from numpy import log
-from numpy import sqrt
+from contextlib import contextmanager
+from profiler import profiler
+
+# numpy is imported lazily, only by functions that use it, this import is seen only by type checkers
+# TYPE_CHECKING is defined here instead of imported, importing typing slows down startup
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import numpy as np
 
 class lib:
     # this color below works only on unixlike shell
@@ -75,6 +79,130 @@ class lib:
                 lib.printFail(f'Error while reading {file}')
                 exit()
 
+    # dump obj in file without indentation and whitespaces
+    # used for machine-only files that need to be loaded fast
+    @staticmethod
+    def dumpCompactJson(file: str, obj) -> None:
+        with open(file, 'w') as f:
+            f.write(dumps(obj, separators=(',', ':')))
+
+    # dump obj in a temp file in the same folder of file and rename it
+    # so file is never left half written, temp name is unique so concurrent writers don't collide
+    # @param indent None for a compact json, see dumpCompactJson()
+    @staticmethod
+    def dumpJsonAtomic(file: str, obj, indent: int | None = None) -> None:
+        from os import fdopen, replace, remove
+        (fd, tmp) = lib.makeTempFile(file)
+        try:
+            with fdopen(fd, 'w') as f:
+                f.write(dumps(obj, separators=(',', ':')) if indent is None else dumps(obj, indent=indent))
+            replace(tmp, file)
+        except BaseException:
+            if path.exists(tmp): remove(tmp)
+            raise
+
+    # create a temp file with a unique name in the same folder of file, so it can be renamed to file
+    # @return (file descriptor, temp file path), see tempfile.mkstemp()
+    @staticmethod
+    def makeTempFile(file: str) -> tuple[int, str]:
+        from tempfile import mkstemp
+        return mkstemp(dir=path.dirname(path.abspath(file)), prefix=path.basename(file)+'.', suffix='.tmp')
+
+    # hold an exclusive lock on file.lock while the with block runs
+    # so processes that read, change and write file don't overwrite each other's changes
+    # the lock is advisory, only processes that use lockFile() wait for it
+    # eg. with lib.lockFile('cached_id_CMC.json'): ...
+    @staticmethod
+    @contextmanager
+    def lockFile(file: str):
+        try:
+            import fcntl
+        except ImportError: # windows
+            fcntl = None
+        with open(file+'.lock', 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try: yield
+                finally: fcntl.flock(f, fcntl.LOCK_UN)
+                return
+
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1) # gives up after 10 seconds
+                    break
+                except OSError: pass
+            try: yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    # return True if file do not exist or it's older than source
+    # used to invalidate files derived from source
+    @staticmethod
+    def isFileOutdated(file: str, source: str) -> bool:
+        if not path.exists(file): return True
+        if not path.exists(source): return False
+        return path.getmtime(file) < path.getmtime(source)
+
+    # parse a json array incrementally, yield one element at a time
+    # so the whole document is never loaded in memory
+    # elements must be objects or arrays eg. [{"id": 1}, {"id": 2}]
+    # @param chunks iterable of bytes eg. response.iter_content()
+    # @param key if the array is a value of an object eg. {"status": {}, "data": [...]} pass "data"
+    @staticmethod
+    def iterJsonArray(chunks, key: str | None = None):
+        from codecs import getincrementaldecoder
+        import re
+        jsonDecoder = JSONDecoder()
+        utf8 = getincrementaldecoder('utf-8')()
+        chunks = iter(chunks)
+        buffer = ''
+
+        # read until the beginning of the array
+        start = re.compile(r'\[' if key is None else r'"'+re.escape(key)+r'"\s*:\s*\[')
+        while (match := start.search(buffer)) is None:
+            chunk = next(chunks, None)
+            if chunk is None: raise ValueError('json array not found')
+            buffer += utf8.decode(chunk)
+        buffer, pos = buffer[match.end():], 0
+
+        while True:
+            # skip separators between elements
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,': pos += 1
+            if pos < len(buffer) and buffer[pos] == ']': return
+            try:
+                if pos == len(buffer): raise decoder.JSONDecodeError('', buffer, pos)
+                item, pos = jsonDecoder.raw_decode(buffer, pos)
+                yield item
+            except decoder.JSONDecodeError:
+                # element is incomplete, read the next chunk
+                chunk = next(chunks, None)
+                if chunk is None: raise ValueError('unexpected end of json array')
+                buffer, pos = buffer[pos:]+utf8.decode(chunk), 0
+
+    # write items in file as a json array, one compact item per line, while yielding them
+    # file is written in a temp file and replaced only when all items have been written
+    # so if items can't be consumed till the end, file is left untouched and the temp file is removed
+    # eg. index = buildIndex(lib.streamJsonArray('coins.json', iterJsonArray(...)))
+    @staticmethod
+    def streamJsonArray(file: str, items):
+        from os import fdopen, replace, remove
+        encoder = JSONEncoder(separators=(',', ':'))
+        (fd, tmp) = lib.makeTempFile(file)
+        try:
+            with fdopen(fd, 'w') as f:
+                f.write('[')
+                for (i, item) in enumerate(items):
+                    f.write((',\n' if i > 0 else '\n')+encoder.encode(item))
+                    yield item
+                f.write('\n]')
+            replace(tmp, file)
+        except BaseException:
+            if path.exists(tmp): remove(tmp)
+            raise
+
     @staticmethod
     def getNextDay(day: str, format = '%d/%m/%Y') -> datetime: 
         return lib.parse_formatDate(day, format) + timedelta(days=1)
@@ -107,6 +235,8 @@ class lib:
             lib.printFail(f"Specify a correct avg_period when calling {lib.calcAvgVolatility.__name__}")
             return None
 
+        from pandas import DataFrame
+        from numpy import log, sqrt
         dataset = DataFrame(total_value) # pandas DF
         dataset = log(dataset/dataset.shift(1)) # numpy.log()
         dataset.fillna(0, inplace = True)
@@ -125,6 +255,56 @@ class lib:
         
         return avg_volatility
 
+    # annualized volatility of every asset and of the portfolio they make, in one pass over the whole matrix
+    # log returns of all assets are computed at once, a return is NaN when the asset
+    # is not held in one of the 2 days, so assets that appear or disappear need no special handling
+    # portfolio return of each day is the average of asset returns weighted by their value of the day before
+    # @param price matrix days x assets, NaN when the asset is not held
+    # @param value matrix days x assets, value of each asset in the same currency
+    # @param avg_period days of the rolling window, clipped to the length of the history
+    # @return (volatility of each asset, volatility of the portfolio) in percentage,
+    #         avarage of the rolling volatility, NaN if there isn't a full window of returns
+    @staticmethod
+    def calcVolatility(price: 'np.ndarray', value: 'np.ndarray', avg_period: int = 30) -> tuple['np.ndarray', float]:
+        import numpy as np
+        if len(price) < 3:
+            return np.full(price.shape[1], np.nan), np.nan
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.log(price[1:]/price[:-1])
+        returns[~np.isfinite(returns)] = np.nan # eg. price 0
+
+        # only assets with a return that day are weighted
+        weight = np.where(np.isnan(returns), 0, np.nan_to_num(value[:-1]))
+        total = weight.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            portfolio = np.where(total > 0, (weight*np.nan_to_num(returns)).sum(axis=1)/total, np.nan)
+
+        window = max(2, min(avg_period, len(returns)))
+        # 365 trading days, crypto market is open year-round, see calcAvgVolatility()
+        volatility = lib.rollingStd(np.column_stack([returns, portfolio]), window)*np.sqrt(365)*100
+        isFull = ~np.isnan(volatility)
+        count = isFull.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_volatility = np.where(count > 0, np.where(isFull, volatility, 0).sum(axis=0)/count, np.nan)
+        return avg_volatility[:-1], float(avg_volatility[-1])
+
+    # rolling standard deviation (ddof = 0) of each column, using cumulative sums instead of a loop over windows
+    # @return matrix len(x)-window+1 x columns, NaN for windows that contain a NaN
+    @staticmethod
+    def rollingStd(x: 'np.ndarray', window: int) -> 'np.ndarray':
+        import numpy as np
+        isValid = ~np.isnan(x)
+        x = np.where(isValid, x, 0)
+        def windowSum(a):
+            cumsum = np.concatenate([np.zeros((1, a.shape[1])), np.cumsum(a, axis=0)])
+            return cumsum[window:]-cumsum[:-window]
+
+        count = windowSum(isValid.astype(np.float64))
+        mean = windowSum(x)/window
+        variance = np.maximum(windowSum(x*x)/window - mean*mean, 0) # rounding may make it slightly negative
+        return np.where(count == window, np.sqrt(variance), np.nan)
+
     @staticmethod
     def isValidDate(date: str, format = '%d/%m/%Y'):
         try:
@@ -191,7 +371,7 @@ class lib:
                     if formated_date_to_update < date_file_line: 
                         # if date_to_update is before the first line's date
                         # add new_record at the beginning of file_path
-                        new_file = new_record + str(open(file_path, 'r').read())
+                        new_file = new_record+'\n' + str(open(file_path, 'r').read())
                         isFirst = False
                         break
 
@@ -210,6 +390,98 @@ class lib:
             else: return False, new_file # return new_file to eventually retry later
         return True, ''
 
+    @staticmethod
+    # same result of updateJson() without rewriting the whole file
+    # if new_record is the newest one, it's appended at the end of file_path
+    # if new_record has the same date and hour of the last one, the last one is replaced
+    # otherwise fallback to updateJson()
+    # date and byte offset of the last record are kept in file_path.idx
+    # so only the tail of file_path is read and written
+    # @return (success, new_record if it has to be written again, how it has been written)
+    #         how it has been written is 'append', 'replace' (the last record) or 'rewrite' (the whole file)
+    def appendJson(file_path: str, date_to_update: str, new_record: str) -> tuple[bool, str, str]:
+        idx_path = file_path+'.idx'
+        formated_date_to_update = datetime.strptime(date_to_update.split(':')[0], '%d/%m/%Y %H')
+
+        try:
+            size = path.getsize(file_path)
+            idx = lib.loadLastRecordIndex(idx_path)
+            # idx is not valid if file_path has been modified by someone else
+            if idx is None or idx['size'] != size:
+                idx = lib.buildLastRecordIndex(file_path)
+
+            last_date = datetime.strptime(idx['date'], '%d/%m/%Y %H') if idx['date'] else None
+            if last_date is not None and formated_date_to_update < last_date:
+                # record in the middle of the history, it needs a full rewrite
+                profiler.count('json.full_rewrites')
+                (isOk, record) = lib.updateJson(file_path, date_to_update, new_record)
+                lib.dumpCompactJson(idx_path, lib.buildLastRecordIndex(file_path))
+                return isOk, record, 'rewrite'
+
+            isReplace = last_date is not None and formated_date_to_update == last_date
+            with open(file_path, 'r+b') as f:
+                if isReplace:
+                    offset = idx['offset'] # overwrite the last record
+                else:
+                    offset = size
+                    # make sure the last record ends with a new line
+                    if size > 0:
+                        f.seek(size-1)
+                        if f.read(1) != b'\n':
+                            f.write(b'\n'); offset += 1
+                f.seek(offset)
+                f.write((new_record+'\n').encode())
+                f.truncate()
+            profiler.count('json.appends')
+
+            lib.dumpCompactJson(idx_path, {
+                'date': formated_date_to_update.strftime('%d/%m/%Y %H'),
+                'offset': offset,
+                'size': offset+len((new_record+'\n').encode())
+            })
+        except OSError as e:
+            lib.printFail(f'Error while writing {file_path}, {e}')
+            return False, new_record, '' # return new_record to eventually retry later
+        return True, '', 'replace' if isReplace else 'append'
+
+    # load the index written by appendJson(), return None if it's missing or corrupted
+    @staticmethod
+    def loadLastRecordIndex(idx_path: str) -> dict | None:
+        try:
+            with open(idx_path, 'r') as f:
+                idx = loads(f.read())
+            return idx if {'date', 'offset', 'size'} <= idx.keys() else None
+        except (OSError, decoder.JSONDecodeError, AttributeError):
+            return None
+
+    # find date and byte offset of the last record of a json-lines file
+    # reading it backward, block by block, until the start of the last line
+    @staticmethod
+    def buildLastRecordIndex(file_path: str, block: int = 8192) -> dict:
+        with open(file_path, 'rb') as f:
+            size = f.seek(0, 2)
+            end = size
+            tail = b''
+            # skip empty lines at the end of file
+            while end > 0:
+                start = max(0, end-block)
+                f.seek(start)
+                tail = f.read(end-start) + tail
+                stripped = tail.rstrip()
+                newline = stripped.rfind(b'\n')
+                if newline != -1 or start == 0:
+                    break
+                end = start
+
+        stripped = tail.rstrip()
+        if len(stripped) == 0:
+            return {'date': None, 'offset': 0, 'size': size}
+
+        newline = stripped.rfind(b'\n')
+        offset = size-len(tail) + newline+1
+        last_date = datetime.strptime(loads(stripped[newline+1:])['date'].split(':')[0], '%d/%m/%Y %H')
+        return {'date': last_date.strftime('%d/%m/%Y %H'), 'offset': offset, 'size': size}
+
     # create /cached_id_CG.json and /cached_id_CMC.json
     # in current working directory (where you run main.py)
     # return a list of full path of created files if succesfully
@@ -217,6 +489,7 @@ class lib:
     @staticmethod
     def createCacheFile():
         cwd = getcwd() # current working directory
+        from platform import system
         joiner = '\\' if system() == 'Windows' else '/'
         cg = cwd+joiner+'cached_id_CG.json'
         cmc = cwd+joiner+'cached_id_CMC.json'
@@ -237,6 +510,7 @@ class lib:
         except FileExistsError: pass
         except FileNotFoundError: lib.printFail('Error on init, check path in settings.json'); return False
         
+        from platform import system
         joiner = '\\' if system() == 'Windows' else '/'
         dirPath = dirPath+joiner
         graficoPath = dirPath+'grafico'
@@ -1,14 +1,19 @@
-from new_api import cg_api_n, cmc_api, yahooGetPriceOf, getTicker
 from lib_tool import lib
-from pandas import read_csv
+from profiler import profiler
 from datetime import datetime
-from numpy import array
 from math import isnan
-import matplotlib.pyplot as plt
-import seaborn as sns
+from os import path
 import argparse
 import json
 
+TYPE_CHECKING = False # see lib_tool
+if TYPE_CHECKING:
+    import numpy as np
+
+# heavy dependencies (pandas, numpy, matplotlib, requests, ...) are imported 
+# only by the methods that use them, so startup stays fast and 
+# runs that don't plot anything never import the plotting stack
+
 # 
 # Calculate your wallet value 
 # add your crypto and fiat in input.csv
@@ -18,24 +23,21 @@ import json
 # wallet data is calculated the same way with both crypto and total type
 # 
 class calculateWalletValue:
+    CSV_CHUNK_ROWS = 100000 # rows of input.csv parsed at once, see loadCSV()
+
     # Initialization variable and general settings
-    def __init__(self, type: str, load = False, privacy = False) -> None:
+    def __init__(self, type: str, load = False, privacy = False, ledger_path = '') -> None:
         self.settings = lib.getSettings()
         self.config = lib.getConfig()
         self.invalid_sym = []
         self.provider = ''
         self.version = self.config['version']
-        self.supportedFiat = self.config['supportedFiat']
-        self.supportedStablecoin = self.config['supportedStablecoin']
+        self.supportedFiat = set(self.config['supportedFiat']) # sets, every input row is looked up
+        self.supportedStablecoin = set(self.config['supportedStablecoin'])
         self.load = load # option to load data from json, see calculateWalletValue.genPltFromJson()
         self.privacy = privacy
-        self.wallet = {
-            # { asset: [[symbol,qta,value, ('crypto' | 'stable' | 'fiat')],] , total_invested: 0, currency: ''}
-            # { asset: [['ATOM', 2, 30, 'crypto'], ['USDC', 21.4, 21.4, 'fiat']]}
-            'asset' : dict(),
-            'total_invested': 0,
-            'currency': self.settings['currency']
-        }
+        self.ledger_path = ledger_path # holdings are derived from transactions when specified, see loadLedger()
+        self.resetWallet()
         lib.printWelcome(f'Welcome to Calculate Wallet Value!')
         lib.printWarn(f'Currency: {self.wallet["currency"]}')
         lib.printWarn(f'Privacy: {"ON" if self.privacy else "OFF"}')
@@ -58,12 +60,14 @@ class calculateWalletValue:
         if self.settings['provider'] == 'cg':
             lib.printWarn('Api Provider: CoinGecko')
             self.provider = 'cg'
-            self.cg = cg_api_n(self.wallet["currency"])
+            from new_api import cg_api_n
+            self.cg = cg_api_n(self.wallet["currency"], self.settings.get('request_timeout', 15), self.settings.get('id_refresh_interval', 3600))
             lib.createFile('all_id_CG.json')
         elif self.settings['provider'] == 'cmc':
             lib.printWarn('Api Provider: CoinMarketCap')
             self.provider = 'cmc'
-            self.cmc = cmc_api(self.wallet["currency"], self.settings['CMC_key'])
+            from new_api import cmc_api
+            self.cmc = cmc_api(self.wallet["currency"], self.settings['CMC_key'], self.settings.get('request_timeout', 15), self.settings.get('id_refresh_interval', 3600))
             lib.createFile('all_id_CMC.json')
         else:
             lib.printFail("Specify a correct price provider")
@@ -71,6 +75,7 @@ class calculateWalletValue:
 
         # fetch all crypto symbol and name from CoinGecko or CoinMarketCap
         # run once or if there is any new crypto
+        # it's downloaded only if it changed, at most once every id_refresh_interval seconds
         if self.settings['fetchSymb'] == True: 
             if self.provider == 'cg':
                 self.cg.fetchID()
@@ -85,12 +90,77 @@ class calculateWalletValue:
             lib.printFail('Unexpected error, pass the correct argument, run again with option --help')
             exit()
 
-    # acquire csv data and convert it to a list
-    # return a list
-    def loadCSV(self) -> list:
-        lib.printWarn('Loading value from input.csv...')
-        df = read_csv('input.csv', parse_dates=True) # pandas.read_csv()
-        return df.values.tolist() # convert dataFrame to list []
+    # empty self.wallet and invalid symbols, to calculate a new wallet value
+    def resetWallet(self) -> None:
+        self.invalid_sym = []
+        from wallet_assets import walletAssets
+        self.wallet = {
+            # { asset: walletAssets, total_invested: 0, currency: ''}
+            # assets are indexed by symbol and type, see walletAssets
+            'asset' : walletAssets(),
+            'total_invested': 0,
+            'currency': self.settings['currency']
+        }
+
+    # acquire csv data, read in chunks of CSV_CHUNK_ROWS rows, and sum qta of each symbol
+    # rows without symbol or with a qta that is not a number are dropped and reported all together
+    # so memory depends on the number of different symbols, not on the number of rows
+    # @return list of [symbol, qta, label], one for each symbol in order of first appearance
+    #         label is not used, see checkInput()
+    def loadCSV(self, file: str = 'input.csv') -> list:
+        lib.printWarn(f'Loading value from {file}...')
+        from pandas import read_csv, to_numeric
+        totals = dict() # symbol -> qta
+        total_invested = None
+        rows, badRows, badSymbols = 0, 0, []
+        # only symbol and qta columns are parsed, as strings, so a malformed row doesn't change types of the others
+        for chunk in read_csv(file, usecols=[0, 1], dtype=str, chunksize=calculateWalletValue.CSV_CHUNK_ROWS):
+            rows += len(chunk)
+            symbol = chunk.iloc[:, 0].str.strip()
+            qta = to_numeric(chunk.iloc[:, 1], errors='coerce')
+            isBad = symbol.isna() | (symbol == '') | qta.isna()
+            if isBad.any():
+                badRows += int(isBad.sum())
+                badSymbols.extend(symbol[isBad & symbol.notna() & (symbol != '')].unique()[:10-len(badSymbols)])
+                symbol, qta = symbol[~isBad], qta[~isBad]
+
+            # the last total_invested row wins
+            isInvested = symbol == 'total_invested'
+            if isInvested.any():
+                total_invested = float(qta[isInvested].iloc[-1])
+                symbol, qta = symbol[~isInvested], qta[~isInvested]
+
+            for (sym, q) in qta.groupby(symbol.str.upper(), sort=False).sum().items():
+                totals[sym] = totals.get(sym, 0.0) + q
+
+        profiler.count('csv.rows', rows)
+        if badRows > 0:
+            profiler.count('csv.bad_rows', badRows)
+            self.invalid_sym.extend(badSymbols)
+            lib.printFail(f'{badRows} row(s) of {file} skipped, symbol or qta missing or not valid{f", eg. {badSymbols}" if badSymbols else ""}')
+            lib.printFail("Check your input.csv file, some value is missing")
+
+        crypto = [[sym, q, float('nan')] for (sym, q) in totals.items()]
+        if total_invested is not None:
+            crypto.append(['total_invested', total_invested, float('nan')])
+        return crypto
+
+    # derive holdings from the transactions in self.ledger_path
+    # only transactions added since the last run are replayed, see ledger
+    # @return list of [symbol, qta, label], same as loadCSV()
+    def loadLedger(self) -> list:
+        lib.printWarn(f'Loading transactions from {self.ledger_path}...')
+        from ledger import ledger
+        with profiler.stage('ledger_replay'):
+            holdings = ledger(self.ledger_path).update()
+        negative = [symbol for (symbol, qta) in holdings.items() if qta < 0]
+        if negative:
+            lib.printWarn(f'More sold than bought of {negative}, some transactions may be missing in {self.ledger_path}')
+        return [[symbol, qta, float('nan')] for (symbol, qta) in holdings.items()]
+
+    # @return holdings from the ledger if specified, from input.csv otherwise
+    def loadInput(self) -> list:
+        return self.loadLedger() if self.ledger_path else self.loadCSV()
 
     # CoinGecko retrieve price of a single crypto
     # return a float
@@ -127,6 +197,7 @@ class calculateWalletValue:
     # get NCIS (crypto index) price
     # will be used to compare volatility of portfolio vs volatility of NCIS
     def getCryptoIndex(self) -> float:
+        from new_api import getTicker
         return getTicker(
             ticker="^NCIS", 
             start=lib.getPreviousDay(lib.getCurrentDay('%Y-%m-%d'), '%Y-%m-%d'), 
@@ -168,42 +239,18 @@ class calculateWalletValue:
                 self.wallet['total_invested'] = qta
                 continue
 
-            # this block of 3 if statement sort the symbol 
-            # in fiat, stablecoin crypto
-            if symbol.lower() in self.supportedFiat:  # FIAT
-                if symbol.upper() in self.getAssetFromWallet(['fiat']):
-                    # when symbol is already in wallet
-                    # add new qta (+=)
-                    self.wallet['asset'][str(symbol).upper()][0] += qta
-                else: 
-                    # when symbol is NOT in wallet
-                    if self.load:
-                        # when self.load is true add qta and value directly
-                        # without += operator since, it get wallet data 
-                        # from walletValue.json record
-                        # this implies that qta and value is correct
-                        self.wallet['asset'][str(symbol).upper()] = [qta, value, 'fiat']
-                    else: 
-                        # add qta, value will be calculated later
-                        self.wallet['asset'][str(symbol).upper()] = [qta, 0.0, 'fiat']
-
-            elif symbol.lower() in self.supportedStablecoin: # STABLE
-                if symbol.upper() in self.getAssetFromWallet(['stable']):
-                    self.wallet['asset'][str(symbol).upper()][0] += qta
-                else: 
-                    if self.load:
-                        self.wallet['asset'][str(symbol).upper()] = [qta, value, 'stable']
-                    else: self.wallet['asset'][str(symbol).upper()] = [qta, 0.0, 'stable']
-
-            else: # CRYPTO
-                if symbol.upper() in self.getAssetFromWallet(['crypto']):
-                    self.wallet['asset'][str(symbol).upper()][0] += qta
-                else: 
-                    if self.load:
-                        self.wallet['asset'][str(symbol).upper()] = [qta, value, 'crypto']
-                    else: self.wallet['asset'][str(symbol).upper()] = [qta, 0.0, 'crypto']
+            # sort the symbol in fiat, stablecoin, crypto
+            symbol = str(symbol).upper()
+            if symbol.lower() in self.supportedFiat: assetType = 'fiat'
+            elif symbol.lower() in self.supportedStablecoin: assetType = 'stable'
+            else: assetType = 'crypto'
+
+            # when symbol is already in wallet only qta is added (+=)
+            # when self.load is true value comes from a walletValue.json record, so it's correct
+            # otherwise value will be calculated later
+            self.wallet['asset'].add(symbol, qta, value if self.load else 0.0, assetType)
         
-        if self.wallet['asset'] == {}:
+        if len(self.wallet['asset']) == 0:
             lib.printFail('File input.csv is empty or have some columns missing')
             exit()
         if err > 0:
@@ -214,100 +261,98 @@ class calculateWalletValue:
     # pass fullItem=True to get a list of [symbol, qta, value, type]
     # pass getQta or getValue to get a list of [symbol, ?qta, ?value]
     def getAssetFromWallet(self, typeOfAsset: list, fullItem = False, getQta = False, getValue = False) -> list[list] | list[str]:
-        if set(typeOfAsset).intersection(set(['crypto', 'stable', 'fiat', 'all'])): # empty set are evaluated False
-            listOfAsset = list()
-            isAll = False
-
-            if 'all' in typeOfAsset: isAll = True
-            for item in self.wallet['asset'].items():
-                
-                item = list(item)
-                item = [item[0]]+item[1]
-                # final result
-                # item=['ATOM', 1.0, 12.5, 'crypto']
-                #       symbol, qta,    value,  type
-                if item[3] in typeOfAsset or isAll: 
-                    if fullItem: listOfAsset.append(item); continue
-                    elif getQta and getValue: listOfAsset.append([item[0], item[1], item[2]]); continue
-                    elif getQta: listOfAsset.append([item[0], item[1]]); continue
-                    elif getValue: listOfAsset.append([item[0], item[2]]); continue
-                    else: listOfAsset.append(item[0]); continue
-
-            return listOfAsset
-
-        else: return []
+        return self.wallet['asset'].get(typeOfAsset, fullItem, getQta, getValue)
+
+    # retrieve crypto prices and forex rates concurrently
+    # crypto prices need one request to the price provider
+    # each fiat that is not the main currency needs one request to yahoo
+    # so wall time is the one of the slowest request instead of the sum of all of them
+    # @param getCryptoPrice self.CGgetPriceOf or self.CMCgetPriceOf
+    # @param cryptoList symbols of crypto and stable
+    # @param fiatList symbols of fiat to exchange in main currency
+    # @return (dict of crypto prices, dict of forex rates eg. {'USD': 0.92})
+    #          forex rate is False if it cannot be retrieved
+    def fetchPrices(self, getCryptoPrice, cryptoList: list[str], fiatList: list[str]) -> tuple[dict, dict]:
+        from new_api import yahooGetPriceOf, getQuoteCache, getRateLimitStats, resetRateLimitStats
+        from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+        timeout = self.settings.get('request_timeout', 15)
+        getQuoteCache().resetStats() # stats of this valuation are saved with the record
+        resetRateLimitStats()
+        pool = ThreadPoolExecutor(max_workers=len(fiatList)+1)
+        try:
+            cryptoFuture = pool.submit(getCryptoPrice, cryptoList) if len(cryptoList) > 0 else None
+            # eg. USDEUR=X is the price of 1 USD in EUR
+            fxFuture = {symbol: pool.submit(yahooGetPriceOf, f'{symbol}{self.wallet["currency"]}=X', timeout) for symbol in fiatList}
+
+            fxRates = dict()
+            for (symbol, future) in fxFuture.items():
+                try:
+                    fxRates[symbol] = future.result(timeout=timeout*2) # connect + read timeout
+                except FuturesTimeoutError:
+                    lib.printFail(f'Error getting price of {symbol}, request timed out')
+                    fxRates[symbol] = False
+            # crypto request handle its own timeout and retries
+            rawData = cryptoFuture.result() if cryptoFuture is not None else dict()
+        finally:
+            pool.shutdown(wait=False)
+
+        throttled = sum(stats['throttled'] for stats in getRateLimitStats().values())
+        if throttled > 0:
+            lib.printWarn(f'{round(throttled, 1)} seconds spent waiting for price providers rate limits')
+        return rawData, fxRates
+
+    # return fiat symbols in self.wallet that need to be exchanged in main currency
+    def getFiatToExchange(self) -> list[str]:
+        return [symbol for symbol in self.getAssetFromWallet(['fiat']) 
+                if symbol.upper() != self.wallet["currency"] and symbol.lower() in self.supportedFiat]
 
     # CoinMarketCap calculate the value of crypto and format data to be used in handleDataPlt()
     def CMCcalcValue(self):
-        tot = 0.0
-        tot_crypto_stable = 0.0
         lib.printWarn('Retriving current price...')
 
-        # get prices of crypto and stable
+        # get prices of crypto and stable, and forex rates of fiat
         cryptoList = self.getAssetFromWallet(['crypto'])
         stableList = self.getAssetFromWallet(['stable'])
-        rawData = self.CMCgetPriceOf(cryptoList+stableList)
-
-        # unpack value and divide it back to crypto and stable
-        for (symbol, price) in rawData.items():
-            value = round(price * self.wallet['asset'][symbol][0] ,2) # price * qta
-            self.wallet['asset'][symbol][1] = value
-            tot += value
-            tot_crypto_stable += value
-
-        for symbol, qta in self.getAssetFromWallet(['fiat'], getQta=True):
-            # if symbol is the main currency -> return the qta
-            if symbol.upper() == self.wallet["currency"]:
-                value = round(qta, 2)
-                tot += value
-                self.wallet['asset'][symbol][1] = value
-
-            # you want to exchange the other fiat currency into the currency in settings
-            elif symbol.lower() in self.supportedFiat:
-                price = yahooGetPriceOf(f'{self.wallet["currency"]}{symbol}=X')
-                value = round(price * qta, 2)
-                self.wallet['asset'][symbol][1] = value
-                tot += value 
-            else:
-                self.invalid_sym.append(symbol)
-
-        self.wallet['total_value'] = round(tot, 2)
-        self.wallet['total_crypto_stable'] = round(tot_crypto_stable, 2)
-        self.wallet['date'] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        rawData, fxRates = self.fetchPrices(self.CMCgetPriceOf, cryptoList+stableList, self.getFiatToExchange())
+        self.applyPrices(rawData, fxRates)
 
     # CoinGecko calculate the value of crypto and format data to be used in handleDataPlt()
     def CGcalcValue(self) -> dict:
-        tot = 0.0
-        tot_crypto_stable = 0.0
         lib.printWarn('Retriving current price...')
 
         cryptoList = self.getAssetFromWallet(['crypto'])
         stableList = self.getAssetFromWallet(['stable'])
-
-        rawData = self.CGgetPriceOf(cryptoList+stableList)
-        for symbol, value in rawData.items():
-            value = round(value * self.wallet['asset'][symbol.upper()][0] ,2)
-            self.wallet['asset'][symbol.upper()][1] = value
-            tot += value
-            tot_crypto_stable += value
+        rawData, fxRates = self.fetchPrices(self.CGgetPriceOf, cryptoList+stableList, self.getFiatToExchange())
+        self.applyPrices(rawData, fxRates)
+
+    # calculate value of each asset in self.wallet and totals
+    # prices of symbols that are not in self.wallet are ignored,
+    # so the same prices can be applied to many wallets, see batchWalletValue
+    # @param rawData dict of crypto prices, symbol as key (any case)
+    # @param fxRates dict of forex rates, see fetchPrices()
+    def applyPrices(self, rawData: dict, fxRates: dict) -> None:
+        assets = self.wallet['asset']
+        for (symbol, price) in rawData.items():
+            symbol = symbol.upper()
+            if symbol not in assets: continue
+            assets.setValue(symbol, round(price * assets[symbol].qta, 2)) # price * qta
 
         for symbol, qta in self.getAssetFromWallet(['fiat'], getQta=True):
             # if symbol is the main currency, just return the qta
             if symbol.upper() == self.wallet["currency"]:
                 price = 1
-            elif symbol.lower() in self.supportedFiat:
+            elif fxRates.get(symbol):
                 # you want to exchange the other fiat currency into the currency in settings
-                price = yahooGetPriceOf(f'{self.wallet["currency"]}{symbol}=X')
+                price = fxRates[symbol]
             else:
                 self.invalid_sym.append(symbol)
                 continue
 
-            value = round(price*qta, 2)
-            self.wallet['asset'][symbol][1] = value
-            tot += value
+            assets.setValue(symbol, round(price*qta, 2))
 
-        self.wallet['total_value'] = round(tot, 2)
-        self.wallet['total_crypto_stable'] = round(tot_crypto_stable, 2)
+        # totals of each type are kept up to date by walletAssets
+        self.wallet['total_value'] = round(assets.getTotal(['all']), 2)
+        self.wallet['total_crypto_stable'] = round(assets.getTotal(['crypto', 'stable']), 2)
         self.wallet['date'] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
 
     # format data to generate PLT
@@ -329,7 +374,7 @@ class calculateWalletValue:
 
                 # group together all element whose value is <= than minimumPieSlice param, specified in settings.json
                 if value / self.wallet['total_crypto_stable'] <= self.settings['minimumPieSlice']:
-                    if symbol_to_visualize[0][0] != 'other':
+                    if len(symbol_to_visualize) == 0 or symbol_to_visualize[0][0] != 'other':
                         # add 'other' as first element
                         symbol_to_visualize = [['other', 0.0], *symbol_to_visualize]
                     # increment value of symbol 'other'
@@ -339,18 +384,11 @@ class calculateWalletValue:
             return symbol_to_visualize
         
         elif self.type == 'total':
-            symbol_to_visualize = [
-                ['Crypto', 0.0], ['Fiat', 0.0]
+            # fiat value includes stablecoins
+            return [
+                ['Crypto', self.wallet['asset'].getTotal(['crypto'])],
+                ['Fiat', self.wallet['asset'].getTotal(['stable', 'fiat'])]
             ]
-            temp = self.getAssetFromWallet(['all'], getValue=True) # merge into one dict
-            for symbol, value in temp:
-                if symbol.lower() not in self.supportedFiat and symbol.lower() not in self.supportedStablecoin:
-                    # crypto
-                    symbol_to_visualize[0][1] += value
-                else: 
-                    # stable and fiat
-                    symbol_to_visualize[1][1] += value
-            return symbol_to_visualize
         else:
             lib.printFail('Unexpected error on wallet type, choose crypto or total')
             exit()
@@ -358,50 +396,54 @@ class calculateWalletValue:
     # create a pie chart, save it(unless self.load is checked) and show it
     def genPlt(self, symbol_to_visualize: list, ) -> None:
         lib.printWarn('Creating pie chart...')
-        mylabels = [] # symbols
-        val = [] # value in currency of symbols
-
-        for (symb, value) in sorted(symbol_to_visualize):
-            mylabels.append(symb)
-            val.append(value)
-
-        y = array(val)# numpy.array()
-
-        # grafic settings
-        sns.set_style('whitegrid')
-        #sns.color_palette('pastel')
-        # define size of the image
-        plt.figure(figsize=(7, 6), tight_layout=True)
-        # create a pie chart with value in 'xx.x%' format
-        plt.pie(y, labels = mylabels, autopct='%1.1f%%', startangle=90, shadow=False)
-
-        # add legend and title to pie chart
-        plt.legend(title = "Symbols:")
-        stable_percentage = self.getStableCoinPercentage()
-        title_stablePercentage = f'Stablecoin Percentage: {" " if stable_percentage < 0 else stable_percentage}%'
-        if self.privacy:
-            # do not show total value
-            plt.title(f'{self.type.capitalize()} Balance: ***** {self.wallet["currency"]} | {self.wallet["date"]}\n{title_stablePercentage}', fontsize=13, weight='bold')
+        with profiler.stage('chart'):
+            import matplotlib.pyplot as plt
+            import seaborn as sns
+            import numpy as np
+            mylabels = [] # symbols
+            val = [] # value in currency of symbols
+
+            for (symb, value) in sorted(symbol_to_visualize):
+                mylabels.append(symb)
+                val.append(value)
+
+            y = np.array(val)# numpy.array()
+
+            # grafic settings
+            sns.set_style('whitegrid')
+            #sns.color_palette('pastel')
+            # define size of the image
+            plt.figure(figsize=(7, 6), tight_layout=True)
+            # create a pie chart with value in 'xx.x%' format
+            plt.pie(y, labels = mylabels, autopct='%1.1f%%', startangle=90, shadow=False)
+
+            # add legend and title to pie chart
+            plt.legend(title = "Symbols:")
+            stable_percentage = self.getStableCoinPercentage()
+            title_stablePercentage = f'Stablecoin Percentage: {" " if stable_percentage < 0 else stable_percentage}%'
+            if self.privacy:
+                # do not show total value
+                plt.title(f'{self.type.capitalize()} Balance: ***** {self.wallet["currency"]} | {self.wallet["date"]}\n{title_stablePercentage}', fontsize=13, weight='bold')
  
-        elif self.type == 'crypto' and self.wallet['total_invested'] > 0:
-            # if type == crypto AND total_invested > 0
-            # show total value and percentage of change given total_invested
-            increasePercent = round((self.wallet['total_crypto_stable'] - self.wallet['total_invested'])/self.wallet['total_invested'] *100, 2)
-            plt.title(f'{self.type.capitalize()} Balance: {self.wallet["total_crypto_stable"]} {self.wallet["currency"]} ({increasePercent}% {"↑" if increasePercent>0 else "↓"}) | {self.wallet["date"]}\n{title_stablePercentage}', fontsize=13, weight='bold')
-        else:
-            # if type == total OR
-            # if type == crypto AND total_invested <= 0
-            if self.type == 'crypto':
-                total = self.wallet['total_crypto_stable']
-            elif self.type == 'total':
-                total = self.wallet['total_value']
-            else: exit()
+            elif self.type == 'crypto' and self.wallet['total_invested'] > 0:
+                # if type == crypto AND total_invested > 0
+                # show total value and percentage of change given total_invested
+                increasePercent = round((self.wallet['total_crypto_stable'] - self.wallet['total_invested'])/self.wallet['total_invested'] *100, 2)
+                plt.title(f'{self.type.capitalize()} Balance: {self.wallet["total_crypto_stable"]} {self.wallet["currency"]} ({increasePercent}% {"↑" if increasePercent>0 else "↓"}) | {self.wallet["date"]}\n{title_stablePercentage}', fontsize=13, weight='bold')
+            else:
+                # if type == total OR
+                # if type == crypto AND total_invested <= 0
+                if self.type == 'crypto':
+                    total = self.wallet['total_crypto_stable']
+                elif self.type == 'total':
+                    total = self.wallet['total_value']
+                else: exit()
 
-            # show total value
-            plt.title(f'{self.type.capitalize()} Balance: {total} {self.wallet["currency"]} | {self.wallet["date"]}\n{title_stablePercentage}', fontsize=13, weight='bold')
+                # show total value
+                plt.title(f'{self.type.capitalize()} Balance: {total} {self.wallet["currency"]} | {self.wallet["date"]}\n{title_stablePercentage}', fontsize=13, weight='bold')
 
-        # format filename using current date
-        filename = self.wallet['date'].replace("/",'_').replace(':','_').replace(' ',' T')+'.png'
+            # format filename using current date
+            filename = self.wallet['date'].replace("/",'_').replace(':','_').replace(' ',' T')+'.png'
 
         if not self.load:
             # when load is enabled it get data from past record from walletValue.json
@@ -421,17 +463,11 @@ class calculateWalletValue:
     # the list is composed of other list that are composed so:
     # [symbol, qta, value]
     def getWalletAsList(self) -> list:
-        li = list()
-        temp = self.getAssetFromWallet(['all'], getQta=True, getValue=True) # merge dict
-        for symbol, qta, value in temp:
-            li.append([symbol, qta, value]) # convert dict to list
-        return li
+        return self.getAssetFromWallet(['all'], getQta=True, getValue=True)
     
     # calculate stablecoin percentage of portfolio
     def getStableCoinPercentage(self) -> float:
-        tot_stable = 0
-        for _ , value in self.getAssetFromWallet(['stable'], getValue=True):
-            tot_stable += value
+        tot_stable = self.wallet['asset'].getTotal(['stable'])
 
         if self.type == 'crypto':
             return round(tot_stable/self.wallet['total_crypto_stable'] * 100, 2)
@@ -447,15 +483,20 @@ class calculateWalletValue:
             'currency': self.wallet['currency'],
             'NCIS': round(self.getCryptoIndex(), 2), # Nasdaq Crypto Index Settlement
         })
-        res = lib.updateJson(self.settings['report_path'], self.wallet['date'], temp)
+        res = lib.appendJson(self.settings['report_path'], self.wallet['date'], temp)
         if res[0]:
             lib.printOk(f'Data successfully saved in {self.settings["report_path"]}')            
         else:
             lib.printFail(f"Failed to update {self.settings['wallet_path']}")   
 
-    # append the record in walletValue.json
-    # it overwrite the record with the same date of today
-    def updateWalletValueJson(self):
+    # append the record in walletValue.json, or in wallet_path if specified
+    # it overwrite the record with the same date and hour of now
+    def updateWalletValueJson(self, wallet_path: str | None = None):
+        wallet_path = wallet_path or self.settings['wallet_path']
+        from new_api import getQuoteCache
+        from history_cache import historyCache
+        from asset_manifest import assetManifest
+        previousSize = path.getsize(wallet_path)
         temp = json.dumps({ # data to be dumped
             'date': self.wallet['date'],
             'total_value': self.wallet['total_value'],
@@ -464,13 +505,20 @@ class calculateWalletValue:
             'currency': self.wallet['currency'],
             'price_provider': f"{'coinMarkerCap' if self.provider == 'cmc' else 'coinGecko' if self.provider == 'cg' else ''}",
             'crypto': [['COIN, QTA, VALUE IN CURRENCY']]+self.getWalletAsList(), # all symbols
+            'price_cache': getQuoteCache().getStats(), # how many prices came from cache and how old they were
             }
         )
-        res = lib.updateJson(self.settings['wallet_path'], self.wallet['date'], temp)
+        with profiler.stage('save_json'):
+            res = lib.appendJson(wallet_path, self.wallet['date'], temp)
         if res[0]:
-            lib.printOk(f'Data successfully saved in {self.settings["wallet_path"]}')            
+            lib.printOk(f'Data successfully saved in {wallet_path}')            
+            # keep reports cache up to date, only the new record is parsed
+            with profiler.stage('history_cache'):
+                historyCache(wallet_path).update()
+            with profiler.stage('asset_manifest'):
+                assetManifest(wallet_path).update(self.wallet['date'], self.getAssetFromWallet(['all']), previousSize, res[2])
         else:
-            lib.printFail(f"Failed to update {self.settings['wallet_path']}")
+            lib.printFail(f"Failed to update {wallet_path}")
 
     # given a past date and json data from walletValue.json file, 
     # create a pie chart
@@ -537,18 +585,175 @@ class calculateWalletValue:
         if self.load:
             self.genPltFromJson()
         else:
-            rawCrypto = self.loadCSV()
-            self.checkInput(rawCrypto)
-            if self.provider == 'cg':
-                rawCrypto = self.CGcalcValue()
-            if self.provider == 'cmc':
-                rawCrypto = self.CMCcalcValue()
+            with profiler.stage('load_csv'):
+                rawCrypto = self.loadInput()
+            with profiler.stage('check_input'):
+                self.checkInput(rawCrypto)
+            with profiler.stage('calc_value'):
+                self.calcValue()
             if self.invalid_sym:
                 self.showInvalidSymbol()
 
-            crypto = self.handleDataPlt()
+            with profiler.stage('handle_data'):
+                crypto = self.handleDataPlt()
             self.genPlt(crypto)
 
+    # calculate the value of self.wallet using the price provider in settings.json
+    def calcValue(self) -> None:
+        if self.provider == 'cg':
+            self.CGcalcValue()
+        if self.provider == 'cmc':
+            self.CMCcalcValue()
+
+    # calculate wallet value from input.csv and save it in walletValue.json
+    # without creating any chart, used by walletDaemon
+    def snapshot(self) -> None:
+        self.resetWallet()
+        with profiler.stage('load_csv'):
+            rawCrypto = self.loadInput()
+        with profiler.stage('check_input'):
+            self.checkInput(rawCrypto)
+        with profiler.stage('calc_value'):
+            self.calcValue()
+        if self.invalid_sym:
+            self.showInvalidSymbol()
+        self.updateWalletValueJson()
+
+# 
+# Save a snapshot of your wallet value in walletValue.json
+# every daemon_interval seconds, specified in settings.json
+# no chart is created, so it can run on a headless machine
+# price provider, symbol index and caches are created once and reused by every snapshot
+# 
+class walletDaemon:
+    def __init__(self, ledger_path: str = '') -> None:
+        # wallet type only affect charts, so it doesn't matter here
+        self.main = calculateWalletValue('total', ledger_path=ledger_path)
+        self.interval = self.main.settings.get('daemon_interval', 3600)
+        if self.interval <= 0:
+            lib.printFail('Specify a daemon_interval greater than 0 in settings.json')
+            exit()
+        lib.printWarn(f'Daemon interval: {self.interval} seconds')
+        self.lastTick = None # time the last snapshot was scheduled at
+
+    # return the next multiple of self.interval after now
+    # eg. with 3600 snapshots are saved at the beginning of every hour
+    def getNextTick(self, now: float) -> float:
+        return (now // self.interval + 1) * self.interval
+
+    def run(self) -> None:
+        from time import time, sleep
+        from new_api import flushIdCaches
+        try:
+            while True:
+                try:
+                    self.main.snapshot()
+                except (Exception, SystemExit) as e:
+                    # keep running, next snapshot may succeed
+                    lib.printFail(f'Snapshot failed, {type(e).__name__} {e}')
+                flushIdCaches() # don't wait the exit to save new symbol conversions
+
+                now = time()
+                nextTick = self.getNextTick(now)
+                if self.lastTick is not None and nextTick - self.lastTick > self.interval:
+                    # snapshot took longer than interval or the machine was suspended,
+                    # missed ticks are skipped since past prices can't be recovered
+                    missed = round((nextTick - self.lastTick) / self.interval) - 1
+                    lib.printWarn(f'{missed} snapshot(s) missed')
+                self.lastTick = nextTick
+                lib.printOk(f'Next snapshot at {datetime.fromtimestamp(nextTick).strftime("%d/%m/%Y %H:%M:%S")}')
+                sleep(nextTick - now)
+        except KeyboardInterrupt:
+            lib.printWarn('^C detected, stopping daemon...')
+
+# 
+# Calculate the value of many portfolios at once
+# source is a directory of csv files (same format of input.csv)
+# or a json manifest: {"portfolios": [{"name": "alice", "input": "alice.csv", "path": "optional/dir"}, ]}
+# relative paths in the manifest are relative to the manifest itself
+# each portfolio is saved in its own walletValue.json, in settings path/name when path is not specified
+# prices of all portfolios are retrieved together, one request to the price provider
+# and one to yahoo for each fiat, no matter how many portfolios there are
+# 
+class batchWalletValue:
+    def __init__(self, source: str) -> None:
+        # wallet type only affect charts, so it doesn't matter here
+        self.main = calculateWalletValue('total')
+        self.portfolios = self.loadPortfolios(source) # [(name, csv path, walletValue.json path), ]
+        if len(self.portfolios) == 0:
+            lib.printFail(f'No portfolio found in {source}')
+            exit()
+        lib.printWarn(f'Portfolios: {len(self.portfolios)}')
+
+    # return list of (name, csv path, walletValue.json path) from a directory or a manifest
+    def loadPortfolios(self, source: str) -> list[tuple[str, str, str]]:
+        if path.isdir(source):
+            from os import listdir
+            items = [{'name': path.splitext(file)[0], 'input': path.join(source, file)} 
+                     for file in sorted(listdir(source)) if file.lower().endswith('.csv')]
+        else:
+            try:
+                with open(source, 'r') as f:
+                    items = json.loads(f.read())['portfolios']
+            except (OSError, json.decoder.JSONDecodeError, KeyError) as e:
+                lib.printFail(f'Error reading batch manifest {source}, {type(e).__name__} {e}')
+                exit()
+            baseDir = path.dirname(path.abspath(source))
+            for item in items:
+                item['input'] = path.join(baseDir, item['input'])
+                if 'path' in item: item['path'] = path.join(baseDir, item['path'])
+
+        portfolios = []
+        for item in items:
+            files = lib.createWorkingFile(item.get('path', path.join(self.main.settings['path'], item['name'])))
+            if not files: exit()
+            portfolios.append((item['name'], item['input'], files[1]))
+        return portfolios
+
+    def run(self) -> None:
+        main = self.main
+        # parse and validate every portfolio before requesting any price
+        wallets = [] # [(name, wallet, walletValue.json path), ]
+        for (name, file, wallet_path) in self.portfolios:
+            lib.printWelcome(f'Portfolio: {name}')
+            main.resetWallet()
+            try:
+                with profiler.stage('load_csv'):
+                    rawCrypto = main.loadCSV(file)
+                with profiler.stage('check_input'):
+                    main.checkInput(rawCrypto)
+            except (Exception, SystemExit) as e:
+                # skip only this portfolio
+                lib.printFail(f'Skipping {name}, {type(e).__name__} {e}')
+                continue
+            if main.invalid_sym:
+                main.showInvalidSymbol()
+            wallets.append((name, main.wallet, wallet_path))
+
+        # union of symbols of all portfolios
+        cryptoSet, fiatSet = set(), set()
+        for (_, wallet, _) in wallets:
+            main.wallet = wallet
+            cryptoSet.update(main.getAssetFromWallet(['crypto', 'stable']))
+            fiatSet.update(main.getFiatToExchange())
+
+        lib.printWarn(f'Retriving current price of {len(cryptoSet)} crypto and {len(fiatSet)} fiat...')
+        main.invalid_sym = []
+        getCryptoPrice = main.CGgetPriceOf if main.provider == 'cg' else main.CMCgetPriceOf
+        with profiler.stage('calc_value'):
+            rawData, fxRates = main.fetchPrices(getCryptoPrice, sorted(cryptoSet), sorted(fiatSet))
+        if main.invalid_sym:
+            main.showInvalidSymbol()
+
+        for (name, wallet, wallet_path) in wallets:
+            main.wallet = wallet
+            main.invalid_sym = []
+            main.applyPrices(rawData, fxRates)
+            if main.invalid_sym:
+                main.showInvalidSymbol()
+            main.updateWalletValueJson(wallet_path)
+        lib.printOk(f'{len(wallets)}/{len(self.portfolios)} portfolios saved')
+
 # 
 # See value of your crypto/total wallet over time
 # based on previous saved data in walletValue.json
@@ -561,7 +766,7 @@ class walletBalanceReport:
         self.version = self.config['version']
         self.supportedFiat = self.config['supportedFiat']
         self.supportedStablecoin = self.config['supportedStablecoin']
-        self.settings['wallet_path'] = self.settings['path']+ '\\walletValue.json'
+        self.settings['wallet_path'] = path.join(self.settings['path'], 'walletValue.json')
         self.data = {
             'date': [],
             'total_value': [],
@@ -578,15 +783,25 @@ class walletBalanceReport:
             lib.printFail('Unexpected error, pass the correct argument, run again with option --help')
             exit()
 
-    # get forex rate based on self.settings["currency"]
-    def getForexRate(self, line: dict):
-        if self.settings["currency"] == 'EUR' and line['currency'] == 'USD':
-            # get forex rate using yahoo api
-            return yahooGetPriceOf(f'{self.settings["currency"]}{line["currency"]}=X')
-        elif self.settings["currency"] == 'USD' and line['currency'] == 'EUR':
-            return yahooGetPriceOf(f'{line["currency"]}{self.settings["currency"]}=X')
-        else:
-            return False
+    # get forex rates to convert values in 'currency' into self.settings["currency"]
+    # historical rates are downloaded once for the whole range of dates and cached, see getFxHistory()
+    # @param date datetime64 array, dates of values to convert
+    # @return array with the rate of each date, using the last available rate for days without it (eg. weekend)
+    #         None if rates cannot be retrieved
+    def getForexRates(self, currency: str, date: 'np.ndarray') -> 'np.ndarray | None':
+        from new_api import getFxHistory
+        import numpy as np
+        day = date.astype('datetime64[D]')
+        # eg. EURUSD=X is the price of 1 EUR in USD, so value in USD / rate = value in EUR
+        rates = getFxHistory(f'{self.settings["currency"]}{currency}=X', day.min().item(), day.max().item(), self.settings.get('request_timeout', 15))
+        if len(rates) == 0:
+            return None
+
+        rateDay = np.array(sorted(rates), dtype='datetime64[D]')
+        rateValue = np.array([rates[d] for d in sorted(rates)])
+        # index of the last rate at or before each day, the first rate for days before it
+        index = np.maximum(np.searchsorted(rateDay, day, side='right')-1, 0)
+        return rateValue[index]
 
     # change the dates between which you view the report
     def chooseDateRange(self):
@@ -611,137 +826,106 @@ class walletBalanceReport:
             else: lib.printFail("Invalid range of date")
 
     # 
-    # load all DATETIME from json file
+    # load all DATETIME from walletValue.json cache
     # to have a complete graph, when the next date is not the following date
     # add the following date and the value of the last update
     # similar to cryptoBalanceReport.retrieveDataFromJson
     #
     def loadDatetime(self) -> None:
         lib.printWarn(f'Loading value from {self.settings["wallet_path"]}...')
-        with open(self.settings['wallet_path'], 'r') as f:
-            firstI = True # first interaction
-            f = list(f) # each element of 'f' is a line
-            for i, line in enumerate(f):
-                if type(line) != dict:
-                    line = json.loads(line)
-
-                # check field needed
-                if 'total_crypto_stable' not in line.keys() and self.type == 'crypto':
-                    continue
-                if 'total_value' not in line.keys() and self.type == 'total':
-                    continue
-
-                temp_date = lib.parse_formatDate(line['date'], format='%d/%m/%Y %H', splitBy=':') # parse date format: dd/mm/yyyy hh
-                if self.type == 'total':
-                    total_value = line['total_value']
-                elif self.type == 'crypto':
-                    total_value = line['total_crypto_stable']
-                else: 
-                    lib.printFail('Unexpected error')
-                    exit()
-
-                # if currency of json line is different from settings.json currency
-                if line['currency'] != self.settings['currency']: 
-                    rate = self.getForexRate(line)
-                    if not rate:
-                        lib.printFail(f'Currency not supported, check {self.settings["wallet_path"]} line: {i+1}')
-                        exit()
-                    total_value /= rate # convert value using current forex rate
-
-                if firstI:
-                    self.data['date'].append(temp_date)
-                    self.data['total_value'].append(total_value)
-                    firstI = False
-                    continue
-                
-                # calculate the last date in list + 1 hour
-                lastDatePlus1h = lib.getNextHour(self.data['date'][-1])
-                # check if temp_date (new date to add) is equal to lastDatePlus1h
-                if temp_date == lastDatePlus1h:
-                    self.data['total_value'].append(total_value)
-                else: # maybe there will be a bug if temp_date < lastDatePlus1h ???
-                    self.data['total_value'].append(self.data['total_value'][-1])
-                    f.insert(int(i)+1, line)
-                    # add line again because we added the same amount of the last in list
-                    # otherwise it didn't work properly
-
-                self.data['date'].append(lastDatePlus1h)
-
-    def __calcTotalVolatility(self):
-        if True:
-            lib.printFail(f'{self.__name__} Unimplemented function')
+        from history_cache import historyCache
+        import numpy as np
+        with profiler.stage('history_cache'):
+            history = historyCache(self.settings['wallet_path']).update()
+        if self.type == 'total':
+            column = history.total_value
+        elif self.type == 'crypto':
+            column = history.total_crypto_stable
+        else: 
+            lib.printFail('Unexpected error')
             exit()
-        # define which assets to calc volatility on
-        assets = dict()
-        with open(self.settings['wallet_path'], 'r') as f:
-            line = json.loads(list(f)[-1])
-            crypto_list = line['crypto'][1:]
-            for item in crypto_list:
-                if item[0] != self.data['currency']:
-                    assets[item[0]] = item[1]/line['total_value']
-        
-        # group data using date of records
-        crypto_data = dict()
-        with open(self.settings['wallet_path'], 'r') as f:
-            for line in f:
-                line = json.loads(line)
-                crypto_list = line['crypto'][1:]
-                date = line['date'].split(' ')[0]
-                total_val = line['total_value']
-                temp = dict()
-                for crypto in crypto_list:
-                    if crypto[0] in assets.keys():
-                        temp[crypto[0]] = crypto[2]/crypto[1]
-                
-                crypto_data[date] = temp
-
-        #print(f'{crypto_data=}')
-        # TODO fix 
-
-        # group data using ticker
-        volatility = dict()
-        for (date, crypto) in crypto_data.items():
-            for (ticker, value) in crypto.items():
-                if ticker not in volatility.keys():
-                    volatility[ticker] = [value]
-                else:
-                    volatility[ticker].append(value)
-
-        # TODO fix minor number of record
-        #print(f'{volatility["EWT"]=}')
-        
-        print(assets)
-        for (ticker, arr) in volatility.items():
-            volatility[ticker] = lib.calcAssetVolatility(arr)
-        
-        vol = int()
-        for (ticker, parz) in volatility.items():
-            vol += parz * assets[ticker]
-
-        vol /= sum(assets.values())
 
-        print(volatility, vol)
+        # skip records without the field needed
+        hasField = ~np.isnan(column)
+        total_value = np.array(column[hasField])
+        currency = history.currency[hasField]
+
+        # convert records whose currency is different from settings.json currency
+        date = history.date[hasField]
+        rate = np.ones(len(date))
+        for (i, cur) in enumerate(history.currencies):
+            isCur = currency == i
+            if cur == self.settings['currency'] or not isCur.any(): continue
+            with profiler.stage('fx_history'):
+                rates = self.getForexRates(cur, date[isCur])
+            if rates is None:
+                lib.printFail(f'Currency not supported, check {self.settings["wallet_path"]} records in {cur}')
+                exit()
+            rate[isCur] = rates
+        total_value /= rate # convert value using forex rate of the record's date
+
+        # kept to calculate volatility of the chosen date range, see calcVolatility()
+        self.history = history
+        self.records = {'index': np.flatnonzero(hasField), 'date': date, 'rate': rate}
+
+        date, total_value = historyCache.resample(date, total_value, 'h')
+        self.data['date'] = date.tolist()
+        self.data['total_value'] = total_value.tolist()
+
+    # annualized volatility of each asset and of the whole portfolio in the chosen date range
+    # uses the last record of each day, values are converted in settings.json currency, see lib.calcVolatility()
+    # fiat are left out of crypto reports
+    def calcVolatility(self) -> None:
+        from history_cache import historyCache
+        import numpy as np
+        history = self.history
+        isAsset = np.array([self.type == 'total' or asset.lower() not in self.supportedFiat for asset in history.assets], dtype=bool)
+        hour = self.records['date'].astype('datetime64[h]')
+        inRange = np.flatnonzero((hour >= np.datetime64(self.data['date'][0], 'h')) & (hour <= np.datetime64(self.data['date'][-1], 'h')))
+
+        # only the rows of the last record of each day are read from the history
+        _, daily = historyCache.resample(self.records['date'][inRange], inRange, 'D')
+        rows = self.records['index'][daily]
+        rate = self.records['rate'][daily][:, np.newaxis]
+        value = history.value[rows][:, isAsset] / rate
+        qta = history.qta[rows][:, isAsset]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price = np.where(qta > 0, value/qta, np.nan)
+
+        assetVolatility, self.volatility = lib.calcVolatility(price, value)
+        assets = [asset for (asset, keep) in zip(history.assets, isAsset) if keep]
+        self.assetVolatility = {
+            asset: float(vol)
+            for (asset, vol) in sorted(zip(assets, assetVolatility), key=lambda item: -item[1])
+            if not np.isnan(vol)
+        }
+        lib.printWarn(f'Portfolio volatility: {f"{round(self.volatility, 2)}%" if not isnan(self.volatility) else "n/a, the date range is too short"}')
+        for (asset, vol) in list(self.assetVolatility.items())[:10]: # the most volatile ones
+            lib.printWarn(f'\t{asset:<10} {round(vol, 2)}%')
 
     # create PLT
     def genPlt(self):
         lib.printWarn(f'Creating chart...')
-        # set background [white, dark, whitegrid, darkgrid, ticks]
-        sns.set_style('darkgrid') 
-        # define size of the image
-        plt.figure(figsize=(7, 6), tight_layout=True)
-        plt.plot(self.data['date'], self.data['total_value'], color='red', marker='')
-        plt.title(f'{self.type.capitalize()} balance from {self.data["date"][0].strftime("%d %b %Y")} to {self.data["date"][-1].strftime("%d %b %Y")}\nVolatility percentage: {round(self.volatility, 2)}% \nCurrency: {self.settings["currency"]}', fontsize=14, weight='bold')
-        # changing the fontsize and rotation of x ticks
-        plt.xticks(fontsize=6.5, rotation = 45)
+        with profiler.stage('chart'):
+            import matplotlib.pyplot as plt
+            import seaborn as sns
+            # set background [white, dark, whitegrid, darkgrid, ticks]
+            sns.set_style('darkgrid') 
+            # define size of the image
+            plt.figure(figsize=(7, 6), tight_layout=True)
+            plt.plot(self.data['date'], self.data['total_value'], color='red', marker='')
+            plt.title(f'{self.type.capitalize()} balance from {self.data["date"][0].strftime("%d %b %Y")} to {self.data["date"][-1].strftime("%d %b %Y")}\nVolatility percentage: {f"{round(self.volatility, 2)}%" if not isnan(self.volatility) else "n/a"} \nCurrency: {self.settings["currency"]}', fontsize=14, weight='bold')
+            # changing the fontsize and rotation of x ticks
+            plt.xticks(fontsize=6.5, rotation = 45)
         plt.show()
 
     def run(self) -> None:
         while True:
-            self.loadDatetime()
+            with profiler.stage('load_history'):
+                self.loadDatetime()
             self.chooseDateRange()
-            # self.volatility = lib.calcAssetVolatility(self.data['total_value'])
-            self.volatility = 0
-            #self.calcTotalVolatility()
+            with profiler.stage('volatility'):
+                self.calcVolatility()
             self.genPlt()
 
             lib.printAskUserInput('Do you want to show another graph? (y/N)')
@@ -765,8 +949,10 @@ class cryptoBalanceReport:
         self.supportedFiat = self.config['supportedFiat']
         self.supportedStablecoin = self.config['supportedStablecoin']
         lib.printWelcome(f'Welcome to Crypto Balance Report!')
-        self.settings['wallet_path'] = self.settings['path']+ '\\walletValue.json'
-        self.cryptos = set()
+        self.settings['wallet_path'] = path.join(self.settings['path'], 'walletValue.json')
+        self.cryptos = []
+        self.manifest = dict()
+        self.matrix = None # loaded with the first ticker chosen, see loadMatrix()
         self.ticker = []
         self.special_ticker = ['stablecoin']
         self.data = {
@@ -775,39 +961,77 @@ class cryptoBalanceReport:
             'fiat': []
         }
 
-    # retrieve all cryptos ever recorded in json file
+    # retrieve all cryptos ever recorded and when they were first and last seen
+    # from the asset manifest, without reading the history, see assetManifest
     def retrieveCryptoList(self) -> None:
-        with open(self.settings['wallet_path'], 'r') as f:
-            for line in f:
-                crypto_list = json.loads(line)['crypto'][1:] # skip the first element, it's ["COIN, QTA, VALUE IN CURRENCY"]
-                for sublist in crypto_list:
-                    self.cryptos.add(sublist[0])
-        
-        self.cryptos = sorted(list(self.cryptos))
+        from asset_manifest import assetManifest
+        with profiler.stage('asset_manifest'):
+            self.manifest = assetManifest(self.settings['wallet_path']).load()
+        if len(self.manifest) == 0:
+            lib.printFail(f'No asset found in {self.settings["wallet_path"]}')
+            exit()
+        self.cryptos = sorted(self.manifest)
 
-    # ask a crypto from user input given a list
+    # read the history once and resample amount and fiat value of every asset on an hourly grid
+    # so any ticker, or many of them, can be charted without reading walletValue.json again
+    # matrices are hours x assets, see self.column for the column of each asset
+    # values are NaN before the first record of an asset, after that if an asset
+    # is not in a record it means that it's being sold so amount = 0 and value = 0
+    # similar to walletBalanceReport.loadDatetime
+    def loadMatrix(self) -> None:
+        lib.printWarn(f'Loading value from {self.settings["wallet_path"]}...')
+        from history_cache import historyCache
+        import numpy as np
+        with profiler.stage('history_cache'):
+            history = historyCache(self.settings['wallet_path']).update()
+        self.column = {asset: i for (i, asset) in enumerate(history.assets)}
+
+        # last record of each hour, both matrices are read in a single pass
+        date, rows = historyCache.resample(history.date, np.arange(len(history)), 'h')
+        amount = history.qta[rows]
+        fiat = history.value[rows]
+        isAfterFirst = np.logical_or.accumulate(~np.isnan(amount), axis=0)
+        self.matrix = {
+            'date': date,
+            'amount': np.where(isAfterFirst, np.nan_to_num(amount), np.nan),
+            'fiat': np.where(isAfterFirst, np.nan_to_num(fiat), np.nan),
+        }
+
+    # ask one or more cryptos from user input given a list
     def getTickerInput(self) -> None:
         for (i, r) in enumerate(self.cryptos):
-            print(f"[{i}] {r}", end='\n')
+            (first, last) = self.manifest[r]
+            print(f"[{i}] {r:<10} {first.split(' ')[0]} - {last.split(' ')[0]}", end='\n')
         
-        lib.printWarn('Type one number...')
+        lib.printWarn('Type one number, more numbers separated by comma or "all"...')
         gotIndex = False
 
         while not gotIndex:
             try:
-                index = int(lib.getUserInput())
-                if index >= 0 and index <= len(self.cryptos):
+                text = lib.getUserInput().replace(' ', '')
+                if text.lower() == 'all':
+                    indexes = list(range(len(self.cryptos)))
+                else:
+                    indexes = [int(i) for i in text.split(',')]
+                if len(indexes) > 0 and all(index >= 0 and index < len(self.cryptos) for index in indexes):
                     gotIndex = True
                 else: lib.printFail('Insert an in range number...')
             except Exception as e:
                 print(e)
                 lib.printFail('Insert a valid number...')
         
-        # handle special_ticker
-        #if index == 0: # stablecoin
-        #    self.ticker = self.supportedStablecoin
-        #else: self.ticker = [self.cryptos[index-len(self.special_ticker)].lower()]
-        self.ticker = self.cryptos[index]
+        self.ticker = [self.cryptos[index] for index in dict.fromkeys(indexes)] # without duplicates
+
+    # select amount and fiat value of self.ticker from the matrices loaded by loadMatrix()
+    # dates begin from the first record of the first ticker held
+    def selectData(self) -> None:
+        import numpy as np
+        columns = [self.column[ticker] for ticker in self.ticker]
+        amount = self.matrix['amount'][:, columns]
+        first = int(np.argmax((~np.isnan(amount)).any(axis=1)))
+        self.data['date'] = self.matrix['date'][first:].tolist()
+        self.data['amount'] = amount[first:]
+        self.data['fiat'] = self.matrix['fiat'][first:, columns]
 
     # change the dates between which you view the report
     def chooseDateRange(self):
@@ -832,86 +1056,64 @@ class cryptoBalanceReport:
                 break
             else: lib.printFail("Invalid range of date")
 
-    # collect amount, fiat value and date
-    # fill amounts of all empty day with the last available
-    # similar to walletBalanceReport.loadDatetime
-    def retrieveDataFromJson(self) -> None:
-        lib.printWarn(f'Loading value from {self.settings["wallet_path"]}...')
-        with open(self.settings['wallet_path'], 'r') as file:
-            firstI = True # first interaction
-            file = list(file) # each element of file is a line
-            for index, line in enumerate(file):
-                temp = json.loads(line)
-                # parse the whole date + hours
-                temp['date'] = lib.parse_formatDate(temp['date'], format='%d/%m/%Y %H', splitBy=':')
-                crypto_list = temp['crypto'][1:] # skip the first element, it's ["COIN, QTA, VALUE IN CURRENCY"]
-                isfound = False
-                for item in crypto_list:
-                    # item[0] is the name of the coin
-                    if item[0] == self.ticker: # filter using user's input ticker
-                        isfound = True
-                        if firstI: # first iteration of external loop
-                            self.data['amount'].append(item[1])
-                            self.data['fiat'].append(item[2])
-                            self.data['date'].append(temp['date'])
-                            firstI = False
-                            continue
-                        
-                        # calculate the last date in self.data['date'] + 1 hour
-                        lastDatePlus1h = lib.getNextHour(self.data['date'][-1])
-                        # check if the new date to add is equal to lastDatePlus1h
-                        if temp['date'] == lastDatePlus1h:
-                            self.data['amount'].append(item[1])
-                            self.data['fiat'].append(item[2])
-                        else: # maybe there will be a bug if temp['date'] < lastDatePlus1h ???
-                            self.data['amount'].append(self.data['amount'][-1])
-                            self.data['fiat'].append(self.data['fiat'][-1])
-                            file.insert( int(index)+1, line) 
-                            # add line again because we added the same amount of the last in list
-                            # otherwise it didn't work properly
-                        self.data['date'].append(lastDatePlus1h)
-                if isfound == False:
-                    if firstI:
-                        # begin to add values from when self.ticker exist in json file
-                        continue
-
-                    # if self.ticker is not found and it's not the first iteration
-                    # it means that self.ticker is being sold so amount = 0 and value = 0
-                    self.data['amount'].append(0)
-                    self.data['fiat'].append(0)     
-                    self.data['date'].append(temp['date'])
-                    isfound = False
-
+    # one ticker: amount and fiat value on the left, price on the right
+    # more tickers: fiat value of each one on the left, price of each one on the right
+    # rebased to 100 at the first date, so they can be compared
     def genPlt(self) -> None:
         lib.printWarn(f'Creating chart...')
-        # set background [white, dark, whitegrid, darkgrid, ticks]
-        sns.set_style('darkgrid') 
-        # create 2 subplots for amount and value over time
-        fig, ax = plt.subplots(1,2, figsize=(13, 8), tight_layout=True)
-
-        # ax[0] has double x axis with amount on the right and fiat value on the left
-        ax0_left_x = ax[0].twinx()
-        ax[0].plot(self.data['date'], self.data['amount'], 'g-')
-        ax0_left_x.plot(self.data['date'], self.data['fiat'], 'r-')
-        ax[0].set_xlabel('Dates')
-        ax[0].set_ylabel('Amount', color='g')
-        ax0_left_x.set_ylabel('Fiat Value', color='r')
-        ax[0].set_title(f'Amount and fiat value of {self.ticker} in {self.settings["currency"]} from {self.data["date"][0].strftime("%d %b %Y")} to {self.data["date"][-1].strftime("%d %b %Y")}', fontsize=11, weight='bold')
-
-        from pandas import DataFrame
-        # ax[1] has price of the coin based on self.data['fiat'] and self.data['amount']
-        ax[1].plot(self.data['date'], DataFrame(self.data['fiat'])/DataFrame(self.data['amount']))
-        ax[1].set_title(f'Price of {self.ticker} in {self.settings["currency"]} from {self.data["date"][0].strftime("%d %b %Y")} to {self.data["date"][-1].strftime("%d %b %Y")}', fontsize=11, weight='bold')
-
-        # changing the fontsize and rotation of x ticks
-        plt.xticks(fontsize=6.5, rotation = 45)
+        with profiler.stage('chart'):
+            import matplotlib.pyplot as plt
+            import seaborn as sns
+            import numpy as np
+            # set background [white, dark, whitegrid, darkgrid, ticks]
+            sns.set_style('darkgrid') 
+            # create 2 subplots for amount and value over time
+            fig, ax = plt.subplots(1,2, figsize=(13, 8), tight_layout=True)
+            dates = f'from {self.data["date"][0].strftime("%d %b %Y")} to {self.data["date"][-1].strftime("%d %b %Y")}'
+            with np.errstate(divide='ignore', invalid='ignore'):
+                price = np.where(self.data['amount'] > 0, self.data['fiat']/self.data['amount'], np.nan)
+
+            if len(self.ticker) == 1:
+                # ax[0] has double x axis with amount on the right and fiat value on the left
+                ax0_left_x = ax[0].twinx()
+                ax[0].plot(self.data['date'], self.data['amount'][:, 0], 'g-')
+                ax0_left_x.plot(self.data['date'], self.data['fiat'][:, 0], 'r-')
+                ax[0].set_xlabel('Dates')
+                ax[0].set_ylabel('Amount', color='g')
+                ax0_left_x.set_ylabel('Fiat Value', color='r')
+                ax[0].set_title(f'Amount and fiat value of {self.ticker[0]} in {self.settings["currency"]} {dates}', fontsize=11, weight='bold')
+
+                # ax[1] has price of the coin based on self.data['fiat'] and self.data['amount']
+                ax[1].plot(self.data['date'], price[:, 0])
+                ax[1].set_title(f'Price of {self.ticker[0]} in {self.settings["currency"]} {dates}', fontsize=11, weight='bold')
+            else:
+                # price of each ticker divided by its first price
+                isPriced = ~np.isnan(price)
+                firstPrice = price[np.argmax(isPriced, axis=0), np.arange(price.shape[1])]
+                for (i, ticker) in enumerate(self.ticker):
+                    ax[0].plot(self.data['date'], self.data['fiat'][:, i], label=ticker)
+                    ax[1].plot(self.data['date'], price[:, i]/firstPrice[i]*100, label=ticker)
+                ax[0].set_xlabel('Dates')
+                ax[0].set_ylabel('Fiat Value')
+                ax[0].set_title(f'Fiat value of {len(self.ticker)} assets in {self.settings["currency"]} {dates}', fontsize=11, weight='bold')
+                ax[1].set_title(f'Price of {len(self.ticker)} assets, 100 = first price {dates}', fontsize=11, weight='bold')
+                if len(self.ticker) <= 15: # more would cover the chart
+                    ax[0].legend()
+                    ax[1].legend()
+
+            # changing the fontsize and rotation of x ticks
+            plt.xticks(fontsize=6.5, rotation = 45)
         plt.show()
 
+    # history is read once, tickers of the next graphs are selected from memory
     def run(self) -> None:
+        self.retrieveCryptoList()
         while True:
-            self.retrieveCryptoList()
             self.getTickerInput()
-            self.retrieveDataFromJson()
+            if self.matrix is None:
+                with profiler.stage('load_history'):
+                    self.loadMatrix()
+            self.selectData()
             self.chooseDateRange()
             self.genPlt()
 
@@ -919,7 +1121,6 @@ class cryptoBalanceReport:
             temp = lib.getUserInput()
             if temp.replace(' ', '') == '' or temp in ['n', 'N']:
                 break
-            self.__init__()
 
 # parse arguments
 def get_args(): 
@@ -931,6 +1132,10 @@ def get_args():
     parser.add_argument('--privacy', dest='privacy', action='store_true', help='obscure total value when used combined with --calc')
     parser.add_argument('--load', dest='load', action='store_true', help='load one past date and view it')
     parser.add_argument('--singleCrypto', dest='singleCrypto', action='store_true', help='view balance of a crypto over time')
+    parser.add_argument('--daemon', dest='daemon', action='store_true', help='save wallet value every daemon_interval seconds, without charts')
+    parser.add_argument('--batch', dest='batch', default='', metavar='SOURCE', help='calculate value of every csv in a directory or in a json manifest, without charts')
+    parser.add_argument('--ledger', dest='ledger', default='', metavar='FILE', help='derive holdings from a csv of transactions instead of input.csv, with --calc or --daemon')
+    parser.add_argument('--profile', dest='profile', nargs='?', const='profile.json', default='', metavar='FILE', help='save time of each stage and i/o counters in a json trace, profile.json by default')
     parser.add_argument('--version', dest='version', action='store_true', help='')
     option = parser.parse_args()
     return option
@@ -938,6 +1143,8 @@ def get_args():
 if __name__ == '__main__':
     option = get_args()
     run = False
+    if option.profile:
+        profiler.enable(option.profile) # trace is saved at exit
     if option.calc:
         if option.load:
             if option.privacy: 
@@ -951,17 +1158,17 @@ if __name__ == '__main__':
 
         elif option.crypto:
             if option.privacy:
-                main = calculateWalletValue('crypto', privacy=True, load=False)
+                main = calculateWalletValue('crypto', privacy=True, load=False, ledger_path=option.ledger)
                 run = True
             else:
-                main = calculateWalletValue('crypto', privacy=False, load=False)
+                main = calculateWalletValue('crypto', privacy=False, load=False, ledger_path=option.ledger)
                 run = True
         elif option.total:
             if option.privacy:
-                main = calculateWalletValue('total', privacy=True, load=False)
+                main = calculateWalletValue('total', privacy=True, load=False, ledger_path=option.ledger)
                 run = True
             else:
-                main = calculateWalletValue('total', privacy=False, load=False)
+                main = calculateWalletValue('total', privacy=False, load=False, ledger_path=option.ledger)
                 run = True
 
     elif option.report:
@@ -974,6 +1181,12 @@ if __name__ == '__main__':
         elif option.singleCrypto:
             main = cryptoBalanceReport()
             run = True
+    elif option.daemon:
+        main = walletDaemon(option.ledger)
+        run = True
+    elif option.batch:
+        main = batchWalletValue(option.batch)
+        run = True
     elif option.version:
         print(lib.getConfig()['version'])
     if run:
@@ -1,15 +1,471 @@
 from lib_tool import lib
-from typing import Any, Union
-from time import sleep
-import pandas_datareader as web
-import yfinance as yf
+from profiler import profiler
+from typing import Any
+from time import sleep, time
+from datetime import datetime, date, timedelta, timezone
+from threading import Lock
+from os import path
+from random import uniform
 import requests
+import atexit
 import json
 
+#
+# On-disk cache of prices shared by all price providers
+# each quote is keyed by (provider, id, currency) eg. "cg|bitcoin|eur"
+# a quote older than ttl seconds is not returned, ttl = 0 disable the cache
+# when there are more than size quotes, the least recently used are evicted
+# the file is written only when new quotes are set, a valuation served by the cache doesn't write it
+#
+class quoteCache:
+    def __init__(self, file: str = 'cached_quotes.json', ttl: float = 60, size: int = 2000) -> None:
+        self.file = file
+        self.ttl = ttl
+        self.size = size
+        self.lock = Lock() # quotes are read and written by concurrent requests
+        self.isChanged = False
+        self.resetStats()
+        try:
+            with open(self.file, 'r') as f:
+                # { key: [price, fetched at, last used at] }
+                self.quotes = json.loads(f.read())
+        except (OSError, json.decoder.JSONDecodeError):
+            self.quotes = dict()
+
+    @staticmethod
+    def key(provider: str, id: str, currency: str) -> str:
+        return f'{provider}|{id}|{currency}'.lower()
+
+    # reset hits, misses and age of the oldest quote used, see getStats()
+    def resetStats(self) -> None:
+        self.hit = 0
+        self.miss = 0
+        self.oldest = 0.0
+
+    # @return price, None if it's not cached or it's older than ttl
+    def get(self, provider: str, id: str, currency: str) -> float | None:
+        with self.lock:
+            now = time()
+            quote = self.quotes.get(quoteCache.key(provider, id, currency))
+            if quote is None or now - quote[1] > self.ttl:
+                self.miss +=1
+                profiler.count('quote_cache.miss')
+                return None
+
+            self.hit +=1
+            profiler.count('quote_cache.hit')
+            self.oldest = max(self.oldest, now - quote[1])
+            # last use is kept in memory for the LRU eviction, a hit alone doesn't rewrite the file
+            # it's written with the next new quote, see dump()
+            quote[2] = now
+            return quote[0]
+
+    def set(self, provider: str, id: str, currency: str, price: float) -> None:
+        if self.ttl <= 0: return
+        with self.lock:
+            now = time()
+            self.quotes[quoteCache.key(provider, id, currency)] = [price, now, now]
+            self.isChanged = True
+
+    # write quotes in self.file if they changed, evicting the least recently used
+    # the cache is only an optimization, if it cannot be written prices are still returned
+    def dump(self) -> None:
+        with self.lock:
+            if not self.isChanged: return
+            if len(self.quotes) > self.size:
+                lru = sorted(self.quotes.items(), key=lambda item: item[1][2], reverse=True)
+                self.quotes = dict(lru[:self.size])
+
+            try:
+                lib.dumpJsonAtomic(self.file, self.quotes)
+            except OSError as e:
+                lib.printWarn(f'Unable to write {self.file}, {e}')
+                return # retried by the next dump()
+            self.isChanged = False
+
+    # @return dict eg. {'hit': 2, 'miss': 1, 'oldest_age': 41.2}
+    #         oldest_age is the age in seconds of the oldest cached quote used
+    def getStats(self) -> dict:
+        return {'hit': self.hit, 'miss': self.miss, 'oldest_age': round(self.oldest, 1)}
+
+_quoteCache = None
+
+# return the quote cache shared by all price providers
+# ttl and size are read from settings.json the first time
+def getQuoteCache() -> quoteCache:
+    global _quoteCache
+    if _quoteCache is None:
+        settings = lib.getSettings()
+        _quoteCache = quoteCache(ttl=settings.get('quote_ttl', 60), size=settings.get('quote_cache_size', 2000))
+    return _quoteCache
+
+#
+# In-memory cache of symbol -> id conversions, kept in a json file
+# changes are written only by flush() and only if something changed
+# flush() reads the file again and applies only the changes made by this process,
+# holding a lock on the file, so entries added meanwhile by other processes are kept
+# file is written with lib.dumpJsonAtomic(), so it's never left half written
+# all caches are flushed at exit, see flushIdCaches()
+# @param field if conversions are a field of the json object eg. "used" in {"fixed": [], "used": {}}
+# @param indent indentation of the file, files that users may edit are indented
+#
+class idCache:
+    def __init__(self, file: str, field: str | None = None, indent: int | None = None) -> None:
+        self.file = file
+        self.field = field
+        self.indent = indent
+        self.lock = Lock()
+        self.changed = dict() # entries set since the last flush
+        self.removed = set() # entries deleted since the last flush
+        self.ids = self.loadIds(self.loadFile())
+        _idCaches.append(self)
+
+    def loadFile(self) -> dict:
+        try:
+            with open(self.file, 'r') as f:
+                return json.loads(f.read())
+        except (OSError, json.decoder.JSONDecodeError):
+            return dict() if self.field is None else {self.field: dict()}
+
+    def loadIds(self, content: dict) -> dict:
+        return content if self.field is None else content.setdefault(self.field, dict())
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.ids
+
+    def __getitem__(self, symbol: str):
+        return self.ids[symbol]
+
+    def __delitem__(self, symbol: str) -> None:
+        with self.lock:
+            del self.ids[symbol]
+            self.changed.pop(symbol, None)
+            self.removed.add(symbol)
+
+    def items(self):
+        return self.ids.items()
+
+    # add new conversions, entries already cached with the same id don't mark the cache as changed
+    def update(self, conversions: dict) -> None:
+        with self.lock:
+            for (symbol, id) in conversions.items():
+                if self.ids.get(symbol) == id: continue
+                self.ids[symbol] = id
+                self.changed[symbol] = id
+                self.removed.discard(symbol)
+
+    def isChanged(self) -> bool:
+        return len(self.changed) > 0 or len(self.removed) > 0
+
+    # write changes in self.file, merged with its current content
+    def flush(self) -> None:
+        with self.lock:
+            if not self.isChanged(): return
+            with lib.lockFile(self.file):
+                content = self.loadFile()
+                ids = self.loadIds(content)
+                ids.update(self.changed)
+                for symbol in self.removed:
+                    ids.pop(symbol, None)
+                lib.dumpJsonAtomic(self.file, content, self.indent)
+            self.ids = ids # include entries of other processes
+            self.changed, self.removed = dict(), set()
+
+_idCaches = []
+
+# write all id caches that changed, called at exit and by walletDaemon after each snapshot
+def flushIdCaches() -> None:
+    for cache in _idCaches:
+        cache.flush()
+
+atexit.register(flushIdCaches)
+
+#
+# HTTP client shared by all price providers
+# one requests.Session for the whole process, so connections are kept alive
+# and reused by every request to the same host, also across valuations in daemon and batch modes
+# at most poolSize connections are open to each host, other requests wait for a free one
+# timeout is the read timeout, connect timeout is at most CONNECT_TIMEOUT seconds
+# pass adapter to send requests somewhere else, eg. a mock transport in tests, see setHttpClient()
+#
+class httpClient:
+    CONNECT_TIMEOUT = 5
+
+    def __init__(self, timeout: float = 15, poolSize: int = 10, adapter = None) -> None:
+        from requests.adapters import HTTPAdapter
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+        if adapter is None:
+            adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    # @param timeout read timeout in seconds, self.timeout if None
+    def get(self, url: str, params: dict | None = None, headers: dict | None = None, timeout: float | None = None, stream: bool = False) -> requests.Response:
+        timeout = timeout or self.timeout
+        res = self.session.get(
+            url, params=params, headers=headers, stream=stream,
+            timeout=(min(httpClient.CONNECT_TIMEOUT, timeout), timeout)
+        )
+        profiler.count('http.requests')
+        if not stream: # bytes of streamed responses are counted while they are read
+            profiler.count('http.bytes', len(res.content))
+        return res
+
+_httpClient = None
+
+# return the http client shared by all price providers
+def getHttpClient() -> httpClient:
+    global _httpClient
+    if _httpClient is None:
+        _httpClient = httpClient(timeout=lib.getSettings().get('request_timeout', 15))
+    return _httpClient
+
+# replace the shared http client, eg. setHttpClient(httpClient(adapter=mockAdapter()))
+def setHttpClient(client: httpClient) -> None:
+    global _httpClient
+    _httpClient = client
+
+class rateLimitError(requests.exceptions.RequestException):
+    pass
+
+#
+# Token bucket shared by all requests to the same provider
+# every request takes a token, tokens are refilled at rate per minute up to burst
+# when the bucket is empty the request waits for the next token
+# rate limited (429) and server error (5xx) responses are retried 
+# after Retry-After header or an exponential backoff with jitter
+# after maxRetries retries rateLimitError is raised
+# time spent waiting is counted, see getStats()
+#
+class rateLimiter:
+    def __init__(self, name: str, rate: float, burst: int = 5, maxRetries: int = 5, baseDelay: float = 2, maxDelay: float = 120) -> None:
+        self.name = name
+        self.rate = rate/60 # tokens per second
+        self.burst = burst
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.tokens = float(burst)
+        self.updatedAt = time()
+        self.lock = Lock() # requests may be made by concurrent threads
+        self.resetStats()
+
+    # reset retries and throttled time, see getStats()
+    def resetStats(self) -> None:
+        self.retries = 0
+        self.throttled = 0.0
+
+    # @return dict eg. {'retries': 1, 'throttled': 12.4}
+    #         throttled is the time in seconds spent waiting for tokens and before retries
+    def getStats(self) -> dict:
+        return {'retries': self.retries, 'throttled': round(self.throttled, 1)}
+
+    def wait(self, seconds: float) -> None:
+        if seconds <= 0: return
+        with self.lock:
+            self.throttled += seconds
+        profiler.count('rate_limit.sleep_s', seconds)
+        sleep(seconds)
+
+    # take a token, wait until one is available
+    def acquire(self) -> None:
+        with self.lock:
+            now = time()
+            self.tokens = min(self.burst, self.tokens + (now-self.updatedAt)*self.rate)
+            self.updatedAt = now
+            # token is taken now, if it's not available yet the bucket goes negative
+            # so next callers wait in line after this one
+            self.tokens -= 1
+            waitTime = -self.tokens/self.rate if self.tokens < 0 else 0
+        self.wait(waitTime)
+
+    # seconds to wait before retry number attempt (0 based)
+    # Retry-After header is used if present, as seconds or as http date
+    # otherwise exponential backoff with jitter: random between half and full delay
+    def getBackoff(self, attempt: int, retryAfter: str | None = None) -> float:
+        if retryAfter:
+            try:
+                return min(self.maxDelay, max(0.0, float(retryAfter)))
+            except ValueError:
+                from email.utils import parsedate_to_datetime
+                try:
+                    return min(self.maxDelay, max(0.0, parsedate_to_datetime(retryAfter).timestamp()-time()))
+                except (TypeError, ValueError):
+                    pass
+        delay = min(self.maxDelay, self.baseDelay * 2**attempt)
+        return uniform(delay/2, delay)
+
+    # make a request with send(), pacing it and retrying it when needed
+    # @param send function with no arguments that make the request eg. lambda: getHttpClient().get(url)
+    # @return response, any status code other than 429 and 5xx is returned to the caller
+    def request(self, send) -> requests.Response:
+        attempt = 0
+        while True:
+            self.acquire()
+            res = send()
+            if res.status_code != 429 and res.status_code < 500:
+                return res
+
+            if attempt >= self.maxRetries:
+                raise rateLimitError(f'{self.name} error {res.status_code}, giving up after {attempt} retries', response=res)
+            waitTime = self.getBackoff(attempt, res.headers.get('Retry-After'))
+            lib.printWarn(f'{self.name} error {res.status_code}, {"you have been rate limited" if res.status_code == 429 else "server error"}, retrying after {round(waitTime, 1)} seconds')
+            with self.lock:
+                self.retries +=1
+            profiler.count('rate_limit.retries')
+            self.wait(waitTime)
+            attempt +=1
+
+# requests per minute allowed by each provider free plan
+# can be changed with rate_limits in settings.json eg. {"cg": 30}
+RATE_LIMITS = {
+    'cg': 30,
+    'cmc': 30,
+    'yahoo': 120,
+}
+_rateLimiters = dict()
+_rateLimitersLock = Lock()
+
+# return the rate limiter shared by all requests to provider ('cg', 'cmc', 'yahoo')
+def getRateLimiter(provider: str) -> rateLimiter:
+    with _rateLimitersLock:
+        if provider not in _rateLimiters:
+            rate = lib.getSettings().get('rate_limits', dict()).get(provider, RATE_LIMITS[provider])
+            _rateLimiters[provider] = rateLimiter({'cg': 'CoinGecko', 'cmc': 'CoinMarketCap', 'yahoo': 'Yahoo'}[provider], rate)
+        return _rateLimiters[provider]
+
+# @return dict eg. {'cg': {'retries': 1, 'throttled': 12.4}, }
+def getRateLimitStats() -> dict[str, dict]:
+    return {provider: limiter.getStats() for (provider, limiter) in _rateLimiters.items()}
+
+def resetRateLimitStats() -> None:
+    for limiter in _rateLimiters.values():
+        limiter.resetStats()
+
+#
+# Coin lists of CoinGecko and CoinMarketCap are downloaded only when they may have changed
+# validators of the last download (ETag, Last-Modified) and the hash of its content
+# are kept in <all_id file>.meta and sent back, so the provider can answer 304 Not Modified
+# fetched_at is the time of the last attempt, failed ones too,
+# so a failing provider is not asked again before the refresh interval
+# eg. {"etag": "W/\"1a2b\"", "last_modified": "...", "hash": "sha256 hex", "fetched_at": 1700000000.0}
+#
+def loadCoinListMeta(all_id_path: str) -> dict:
+    try:
+        with open(all_id_path+'.meta', 'r') as f:
+            return json.loads(f.read())
+    except (OSError, json.decoder.JSONDecodeError):
+        return dict()
+
+def dumpCoinListMeta(all_id_path: str, meta: dict) -> None:
+    lib.dumpCompactJson(all_id_path+'.meta', meta)
+
+# headers of a conditional request, empty if coin list was never downloaded
+def getConditionalHeaders(meta: dict) -> dict:
+    headers = dict()
+    if meta.get('etag'): headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'): headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
+# return True if coin list has been downloaded less than interval seconds ago
+def isCoinListRecent(all_id_path: str, interval: float) -> bool:
+    return hasCoinList(all_id_path) and time() - loadCoinListMeta(all_id_path).get('fetched_at', 0) < interval
+
+# return True if coin list has been downloaded, an empty file is created by calculateWalletValue
+def hasCoinList(all_id_path: str) -> bool:
+    return path.exists(all_id_path) and path.getsize(all_id_path) > 0
+
+# @return coin list, None if it's missing, empty or corrupted
+def loadCoinList(all_id_path: str) -> list | dict | None:
+    if not hasCoinList(all_id_path): return None
+    try:
+        with open(all_id_path, 'r') as f:
+            return json.loads(f.read())
+    except (OSError, json.decoder.JSONDecodeError):
+        lib.printFail(f'{all_id_path} is corrupted, set fetchSymb to true in settings.json to download it again')
+        return None
+
+# yield chunks while adding them to hasher
+def hashChunks(chunks, hasher):
+    for chunk in chunks:
+        hasher.update(chunk)
+        profiler.count('http.bytes', len(chunk))
+        yield chunk
+
+# compare old and new symbol index
+# @return (added symbols, removed symbols, symbols whose ids changed)
+def diffIndex(old: dict[str, list[str]], new: dict[str, list[str]]) -> tuple[set, set, set]:
+    added = new.keys() - old.keys()
+    removed = old.keys() - new.keys()
+    changed = {symbol for symbol in old.keys() & new.keys() if old[symbol] != new[symbol]}
+    return added, removed, changed
+
+# download a coin list only if it changed since the last download
+# the list is parsed while it's downloaded and each coin is written in all_id_path
+# and passed to buildIndex as soon as it's parsed, so the whole list is never in memory
+# @param provider 'cg' or 'cmc', see getRateLimiter()
+# @param toItem function that keeps only the used fields of a coin
+# @param buildIndex function that builds the symbol index from an iterable of coins
+# @param key see lib.iterJsonArray()
+# @return the new index, None if coin list didn't change
+# @raise requests.RequestException, ValueError or KeyError if it cannot be downloaded or parsed
+def fetchCoinList(provider: str, url: str, all_id_path: str, headers: dict, timeout: float, toItem, buildIndex, key: str | None = None) -> dict | None:
+    from hashlib import sha256
+    name = {'cg': 'CoinGecko', 'cmc': 'CoinMarketCap'}[provider]
+    # without a coin list, validators of the last download must not be sent
+    meta = loadCoinListMeta(all_id_path) if hasCoinList(all_id_path) else dict()
+    try:
+        res = getRateLimiter(provider).request(lambda: getHttpClient().get(
+            url, headers={**headers, **getConditionalHeaders(meta)}, timeout=timeout, stream=True
+        ))
+        with res:
+            if res.status_code == 304:
+                meta['fetched_at'] = time()
+                dumpCoinListMeta(all_id_path, meta)
+                lib.printOk(f'{name} coin list is already up to date')
+                return None
+            if res.status_code != 200:
+                raise requests.HTTPError(f'{name} error {res.status_code}', response=res)
+
+            hasher = sha256()
+            coin = (toItem(crypto) for crypto in lib.iterJsonArray(hashChunks(res.iter_content(chunk_size=65536), hasher), key))
+            index = buildIndex(lib.streamJsonArray(all_id_path, coin))
+    except (requests.exceptions.RequestException, ValueError, KeyError):
+        # record the attempt anyway, the old coin list is kept until the next refresh
+        meta['fetched_at'] = time()
+        dumpCoinListMeta(all_id_path, meta)
+        raise
+
+    dumpCoinListMeta(all_id_path, {
+        'etag': res.headers.get('ETag'),
+        'last_modified': res.headers.get('Last-Modified'),
+        'hash': hasher.hexdigest(),
+        'fetched_at': time(),
+    })
+    if hasher.hexdigest() == meta.get('hash'):
+        # provider doesn't support conditional requests, but content is the same
+        lib.printOk(f'{name} coin list is already up to date')
+        return None
+    lib.printOk('Coin list successfully fetched and saved')
+    return index
+
+#
+# CoinGecko Api
+#
 class cg_api_n():
-    def __init__(self, currency: str) -> None:
+    BASEURL = 'https://api.coingecko.com/api/v3/'
+    # limits of a single simple/price request, larger requests are split in chunks
+    MAX_URL_LENGTH = 2000 # characters, many servers and proxies reject longer urls
+    MAX_IDS_PER_REQUEST = 250
+    MAX_PARALLEL_REQUESTS = 4 # chunks requested at the same time
+
+    def __init__(self, currency: str, timeout: float = 15, refreshInterval: float = 3600) -> None:
         self.currency = currency.lower()
-        self.baseurl = 'https://api.coingecko.com/api/v3/'
+        self.timeout = timeout # seconds to wait for each step of a request (connect, read)
+        self.refreshInterval = refreshInterval # minimum seconds between two downloads of the coin list
+        self.baseurl = cg_api_n.BASEURL
 
         ''' CoinGecko price oracle do NOT work with ticker(eg. $eth, $btc) but with its own id
             it may happen that one ticker have multiple id:
@@ -26,29 +482,81 @@ class cg_api_n():
 
         self.cacheFile = 'cached_id_CG.json'
         self.all_id_path = 'all_id_CG.json'
-        cg_cache = lib.loadJsonFile(self.cacheFile)
-        self.fixedSymbol = cg_cache['fixed']
-        self.usedSymbol = cg_cache['used']
+        self.index_path = 'index_id_CG.json'
+        self.symbolIndex = None # loaded lazily, see getSymbolIndex()
+        self.fixedSymbol = lib.loadJsonFile(self.cacheFile)['fixed']
+        self.usedSymbol = idCache(self.cacheFile, field='used', indent=4) # written at exit, see idCache
         
-        try:
-            with open(self.all_id_path, 'r') as f:
-                if len(f.read()) == 0:
-                    f.close()
-                    self.fetchID()
-        except FileNotFoundError: 
-            self.fetchID()
-        except Exception as e:
-            lib.printFail(str(e))
+        # first run, or the first download failed
+        if not hasCoinList(self.all_id_path) and not self.fetchID(force=True):
+            lib.printFail('Unable to download CoinGecko coin list, check your connection and retry')
             exit()
 
     # fetch all id, symbol and name from CoinGecko, run only once in a while to update it
-    def fetchID(self) -> None: 
-        path = 'coins/list'
-        coin = requests.get(self.baseurl+path).json()
+    # it's downloaded only if it changed, see fetchCoinList()
+    # @param force download it even if it has been downloaded less than self.refreshInterval seconds ago
+    # @return True if coin list changed
+    def fetchID(self, force: bool = False) -> bool: 
+        if not force and isCoinListRecent(self.all_id_path, self.refreshInterval):
+            lib.printOk(f'Coin list has been fetched less than {self.refreshInterval} seconds ago')
+            return False
+        try:
+            old = self.getSymbolIndex()
+        except (OSError, ValueError): # first download
+            old = dict()
+
+        try:
+            new = fetchCoinList(
+                'cg', self.baseurl+'coins/list', self.all_id_path, dict(), self.timeout,
+                lambda crypto: {'id': crypto['id'], 'symbol': crypto['symbol'], 'name': crypto['name']},
+                self.buildIndex # coin list changed, rebuild the index
+            )
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            # keep using the old coin list
+            lib.printFail(f'Error fetching coin list, {type(e).__name__} {e}')
+            return False
+        if new is None: return False
+        self.mergeIndex(old, new)
+        return True
+
+    # forget cached ids that are not in the new index anymore, 
+    # so their symbols are converted again, ids chosen by the user are kept if they still exist
+    def mergeIndex(self, old: dict[str, list[str]], new: dict[str, list[str]]) -> None:
+        added, removed, changed = diffIndex(old, new)
+        lib.printOk(f'Coin list: {len(added)} new symbol(s), {len(removed)} removed, {len(changed)} changed')
+        stale = [symbol for (symbol, id) in self.usedSymbol.items() if id not in new.get(symbol, [])]
+        for symbol in stale:
+            del self.usedSymbol[symbol]
+
+    # build a symbol -> [ids] index from coin list and save it in index_id_CG.json
+    # index_id_CG.json is a compact json, it's faster to load than all_id_CG.json
+    # @param coin iterable of dict eg. [{'id': 'ethereum', 'symbol': 'eth', 'name': 'Ethereum'}, ]
+    # @return dict eg. {'eth': ['ethereum', 'ethereum-wormhole'], }
+    def buildIndex(self, coin) -> dict[str, list[str]]:
+        index = dict()
+        for crypto in coin:
+            index.setdefault(crypto['symbol'].lower(), []).append(crypto['id'])
+
+        lib.dumpCompactJson(self.index_path, index)
+        self.symbolIndex = index
+        return index
 
-        with open('all_id_CG.json', 'w') as f:
-            f.write(json.dumps(coin, indent=4))
-        lib.printOk('Coin list successfully fetched and saved')
+    # return symbol index, load it only the first time it's needed
+    # index is rebuilt if it's missing, corrupted or older than all_id_CG.json
+    def getSymbolIndex(self) -> dict[str, list[str]]:
+        if self.symbolIndex is not None:
+            return self.symbolIndex
+
+        if not lib.isFileOutdated(self.index_path, self.all_id_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    self.symbolIndex = json.loads(f.read())
+                return self.symbolIndex
+            except json.decoder.JSONDecodeError:
+                lib.printWarn(f'{self.index_path} is corrupted, rebuilding it...')
+
+        data = loadCoinList(self.all_id_path)
+        return self.buildIndex(data) if data is not None else dict()
 
     # convert 'find' to CoinGecko id
     # @param find crypto ticker eg. "ETH" "eth"
@@ -62,22 +570,19 @@ class cg_api_n():
         # check if items in find list are already cached in cached_id_CG.json['used]
         # if so pop it from find list
         for crypto in find.copy():
-            if crypto in self.usedSymbol.keys():
+            if crypto in self.usedSymbol:
                 res[crypto] = self.usedSymbol[crypto]
                 find.pop(find.index(crypto))
 
-        # retrieve all possible id from all_id_CG.json file
-        temp = dict()
-        with open(self.all_id_path, 'r') as f:
-            filedata = json.loads(f.read())
-
-            for crypto in filedata:
-                if crypto['symbol'] in find:
-                    # add if new, append if other possible valid id were found 
-                    if crypto['symbol'] not in temp.keys():
-                        temp[crypto['symbol']] = [crypto['id']]
-                    else:
-                        temp[crypto['symbol']].append(crypto['id'])
+        # retrieve all possible id from the symbol index, see getSymbolIndex()
+        index = self.getSymbolIndex()
+        # unknown symbols may be new coins, refresh the coin list at most once every self.refreshInterval
+        unknown = [crypto for crypto in find if crypto not in index]
+        if len(unknown) > 0 and not isCoinListRecent(self.all_id_path, self.refreshInterval):
+            lib.printWarn(f'Symbol(s) {unknown} not found, refreshing coin list...')
+            if self.fetchID(force=True):
+                index = self.getSymbolIndex()
+        temp = {crypto: index[crypto] for crypto in find if crypto in index}
 
         # extract correct id using cached_id_CG.json['fixed'], otherwise print error
         err_count = 0
@@ -101,27 +606,10 @@ class cg_api_n():
             lib.printFail(f'Add the correct one in {lib.WARNING_YELLOW}{self.cacheFile}{lib.ENDC} in fixed field')
             res['error'] = True
         
-        # update self.usedSymbol and dump it to cached_id_CG.json['used']
-        self.usedSymbol.update(res)
-        self.dumpUsedId()
+        # update self.usedSymbol, it's written in cached_id_CG.json['used'] only if it changed
+        self.usedSymbol.update(self.deleteControlItem(dict(res)))
         return res, checkSet-set(res.keys())
 
-    # dump self.usedSymbol in cached_id_CG.json
-    # note this function read and write cached_id_CG.json file 
-    # BUT 'fixed' obj in NOT modified
-    def dumpUsedId(self) -> None:
-        with open(self.cacheFile, 'r') as f:
-            # load 'fixed' and 'used' json object
-            temp = json.loads(f.read())
-        
-        # update 'used' json object
-        temp['used'] = self.usedSymbol
-        temp['used'] = self.deleteControlItem(temp['used'])
-
-        # dump json obj and write the new file
-        with open(self.cacheFile, 'w') as f:
-            f.write(json.dumps(temp, indent=4))
-
     # delete item in listToBeDeleted from a dict with str as key and any type of data as value
     def deleteControlItem(self, response: dict[str, Any]) -> dict[str, Any]:
         listToBeDeleted = ['error']
@@ -133,26 +621,39 @@ class cg_api_n():
 
     def getPriceOf(self, find: list[str]) -> dict[str, float]:
         path = 'simple/price'
-        id, missingCryptoFromConvert = self.convertSymbol2ID(find=find)
+        with profiler.stage('resolve_ids'):
+            id, missingCryptoFromConvert = self.convertSymbol2ID(find=find)
         id = self.deleteControlItem(id)
         priceToReturn = dict()
         checkSet = set(id.keys())
-        param = {
-            'ids': ','.join(id.values()),
-            'vs_currencies': self.currency,
-            'precision': 2
-        }
 
-        # make request and retrieve a dict from json obj
-        res = self.makeRequest(url=self.baseurl+path, param=param).json()
-        # format data correctly
-        for item in res:
-            index = [i for i in id if id[i] == item][0]
-            if res[item] == {}:
-                # data price not available, most likely coin is 'Preview Only'
-                priceToReturn[index] = 0
-            else: # all good
-                priceToReturn[index] = res[item][self.currency]
+        # use cached prices if they are recent enough, see quoteCache
+        cache = getQuoteCache()
+        for (symbol, cgId) in id.items():
+            price = cache.get('cg', cgId, self.currency)
+            if price is not None: priceToReturn[symbol] = price
+        id = {symbol: cgId for (symbol, cgId) in id.items() if symbol not in priceToReturn}
+
+        if len(id) > 0:
+            # more symbols may share the same id
+            symbolsOf = dict()
+            for (symbol, cgId) in id.items():
+                symbolsOf.setdefault(cgId, []).append(symbol)
+
+            with profiler.stage('quote_request'):
+                res = self.requestPrices(self.baseurl+path, list(symbolsOf.keys()))
+            # format data correctly
+            for (item, price) in res.items():
+                if item not in symbolsOf: continue
+                if price == {}:
+                    # data price not available, most likely coin is 'Preview Only'
+                    price = 0
+                else: # all good
+                    price = price[self.currency]
+                    cache.set('cg', item, self.currency, price)
+                for symbol in symbolsOf[item]:
+                    priceToReturn[symbol] = price
+            cache.dump()
 
         missingCryptoFromPrice = checkSet-set(priceToReturn.keys())
         if len(missingCryptoFromConvert) > 0:
@@ -163,82 +664,126 @@ class cg_api_n():
 
         return priceToReturn, missingCryptoFromConvert, missingCryptoFromPrice
 
-    def makeRequest(self, url: str, param: dict[str, Any]) -> requests.Response:
-        error_count = 0
-        sleep_time = 0
-        msg = ''
+    # split ids in chunks that fit in one simple/price request
+    # both the number of ids and the length of the encoded url are limited
+    # @param baseLength length of the url without ids
+    def chunkIds(self, ids: list[str], baseLength: int) -> list[list[str]]:
+        from urllib.parse import quote
+        chunks = [[]]
+        length = baseLength
+        for id in ids:
+            idLength = len(quote(id, safe=''))+3 # "," is encoded as "%2C"
+            if len(chunks[-1]) > 0 and \
+                    (length+idLength > cg_api_n.MAX_URL_LENGTH or len(chunks[-1]) >= cg_api_n.MAX_IDS_PER_REQUEST):
+                chunks.append([])
+                length = baseLength
+            chunks[-1].append(id)
+            length += idLength
+        return chunks
 
-        while True:
-            res = requests.get(url=url, params=param)
-            if res.status_code == 200: # all good
-                return res
+    # retrieve prices of ids, in chunks requested in parallel
+    # @return dict eg. {'bitcoin': {'eur': 61234.5}, 'preview-coin': {}}
+    #         ids whose price cannot be retrieved are not in it
+    def requestPrices(self, url: str, ids: list[str]) -> dict[str, dict]:
+        param = {'ids': '', 'vs_currencies': self.currency, 'precision': 2}
+        baseLength = len(requests.Request('GET', url, params=param).prepare().url)
+        chunks = self.chunkIds(ids, baseLength)
+        if len(chunks) == 1:
+            return self.requestChunk(url, param, chunks[0])
 
-            elif res.status_code == 429: # rate limit
-                sleep_time = 110
-                error_count +=1
-                msg = 'you have been rate limited'
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(len(chunks), cg_api_n.MAX_PARALLEL_REQUESTS)) as pool:
+            results = pool.map(lambda chunk: self.requestChunk(url, param, chunk), chunks)
+            res = dict()
+            for result in results:
+                res.update(result)
+        return res
 
-            elif str(res.status_code)[0] == '5': # server errors
-                error_count +=1
-                sleep_time = 20
-                msg = 'server error'
+    # request prices of a single chunk
+    # if the request is rejected as too big or malformed, or its response cannot be parsed,
+    # the chunk is split in half and each half is requested again
+    # so a bad id or an oversized request doesn't fail the other ids
+    # any other error fails the whole chunk, splitting would only make more requests
+    def requestChunk(self, url: str, param: dict[str, Any], chunk: list[str]) -> dict[str, dict]:
+        try:
+            res = self.makeRequest(url=url, param={**param, 'ids': ','.join(chunk)}).json()
+            if not isinstance(res, dict): raise ValueError(f'unexpected response {str(res)[:100]}')
+            return res
+        except rateLimitError as e:
+            # provider is down or rate limiting
+            lib.printFail(f'{e}, {len(chunk)} price(s) cannot be retrieved')
+            lib.printFail("CoinGecko api may be down, please visit https://status.coingecko.com/")
+            return dict()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if not cg_api_n.isSplittable(e):
+                # eg. connection error, timeout, 401, 403, 404
+                lib.printFail(f'CoinGecko error, {len(chunk)} price(s) cannot be retrieved, {type(e).__name__} {e}')
+                return dict()
+            if len(chunk) == 1:
+                lib.printFail(f'CoinGecko error, price of {chunk[0]} cannot be retrieved, {type(e).__name__} {e}')
+                return dict()
+            half = len(chunk)//2
+            lib.printWarn(f'CoinGecko error, splitting request of {len(chunk)} ids, {type(e).__name__}')
+            return {**self.requestChunk(url, param, chunk[:half]), **self.requestChunk(url, param, chunk[half:])}
 
-            else: # all other possible errors
-                error_count +=1
-                sleep_time = 30
+    # @return True if e may be caused by the size of the request or by a single id
+    #         ie. HTTP 400, 413, 414 or a response that cannot be parsed
+    @staticmethod
+    def isSplittable(e: Exception) -> bool:
+        if isinstance(e, ValueError): return True # includes json errors of requests
+        response = getattr(e, 'response', None)
+        return isinstance(e, requests.HTTPError) and response is not None and response.status_code in [400, 413, 414]
 
-            if error_count > 5:
-                lib.printFail("CoinGecko api may be down, please visit https://status.coingecko.com/")
-            lib.printWarn(f'Error {res.status_code}, {msg}{", " if msg != "" else ""}retrying after {sleep_time} seconds')
-            sleep(sleep_time)
+    # make a request paced by the CoinGecko rate limiter, see rateLimiter
+    # 429 and 5xx are retried by the rate limiter, rateLimitError is raised when it gives up
+    def makeRequest(self, url: str, param: dict[str, Any]) -> requests.Response:
+        res = getRateLimiter('cg').request(lambda: getHttpClient().get(url, params=param, timeout=self.timeout))
+        if res.status_code in [400, 413, 414]: # request is malformed or too long
+            # retrying the same request doesn't help, let the caller split it
+            res.raise_for_status()
+        elif res.status_code != 200:
+            raise requests.HTTPError(f'CoinGecko error {res.status_code}', response=res)
+        return res
 
-from requests import Session
 from requests.exceptions import ConnectionError, Timeout, TooManyRedirects
-from random import randrange
 
 #
 # CoinMarketCap Api
 #
 class cmc_api:
-    def __init__(self, currency: str, api_key: str) -> None:
+    BASEURL = 'https://pro-api.coinmarketcap.com/v1/'
+
+    def __init__(self, currency: str, api_key: str, timeout: float = 15, refreshInterval: float = 3600) -> None:
         if len(api_key) == 0:
             lib.printFail('CMC API error, no api key provided')
             exit()        
         self.currency = currency
+        self.timeout = timeout # seconds to wait for each step of a request (connect, read)
+        self.refreshInterval = refreshInterval # minimum seconds between two downloads of the coin list
         self.key = api_key
-        self.baseurl = f'https://pro-api.coinmarketcap.com/v1/'
+        self.baseurl = cmc_api.BASEURL
         self.cacheFile = 'cached_id_CMC.json'
         self.all_id_path = 'all_id_CMC.json'
+        self.index_path = 'index_id_CMC.json'
+        self.symbolIndex = None # loaded lazily, see getSymbolIndex()
         # create cache file
         files = lib.createCacheFile()
         if not files: exit()
-        self.cachedSymbol = lib.loadJsonFile(self.cacheFile)    
+        self.cachedSymbol = idCache(self.cacheFile) # written at exit, see idCache
         
-        headers = { 
+        # sent with every request, see getHttpClient()
+        self.headers = { 
             'Accepts': 'application/json',
-            'Accept-Encoding': 'deflate, gzip',
             'X-CMC_PRO_API_KEY': self.key,
         }
 
-        self.session = Session()
-        self.session.headers.update(headers)
-
         if not self.isKeyValid():
             lib.printFail('CMC API error, api key provided is not valid')
             exit()
 
-        try:
-            with open(self.all_id_path, 'r') as f:
-                try: 
-                    json.loads(f.read())['data']
-                except KeyError: 
-                    f.close()
-                    self.fetchID()
-
-        except FileNotFoundError: 
-            self.fetchID()
-        except Exception as e:
-            lib.printFail(str(e))
+        # first run, or the first download failed
+        if not hasCoinList(self.all_id_path) and not self.fetchID(force=True):
+            lib.printFail('Unable to download CoinMarketCap coin list, check your connection and retry')
             exit()
 
     # check that self.key is valid by making a request to CMC endpoint
@@ -248,61 +793,125 @@ class cmc_api:
             return False
 
         path = 'key/info'
-        while True:
-            res = self.session.get(self.baseurl+path)
-            if res.status_code == 200:
-                return True
-            elif res.status_code == 429:
-                lib.printWarn('You have been rate limited, sleeping for 60 second')
-                sleep(60)
-            elif res.status_code == 500:
-                x = randrange(range(50,160))
-                lib.printWarn(f'Server error, sleeping for {x}')
-                sleep(x)
-            else: # all others status code means that key is not valid
-                return False
+        try:
+            # 429 and 5xx are retried by the rate limiter
+            res = getRateLimiter('cmc').request(lambda: getHttpClient().get(self.baseurl+path, headers=self.headers, timeout=self.timeout))
+        except (rateLimitError, ConnectionError, Timeout) as e:
+            lib.printFail(f'{e}, unable to check the api key')
+            return False
+        # all others status code means that key is not valid
+        return res.status_code == 200
 
     # fetch all id, symbol and name from CMC, run only once in a while to update it
-    def fetchID(self) -> int:
-        url = 'cryptocurrency/map'
-        res = self.session.get(self.baseurl+url)
-        open(self.all_id_path, 'w').write(json.dumps(res.json(), indent=4))
-        lib.printOk('Coin list successfully fetched and saved')
+    # it's downloaded only if it changed, see fetchCoinList()
+    # @param force download it even if it has been downloaded less than self.refreshInterval seconds ago
+    # @return True if coin list changed
+    def fetchID(self, force: bool = False) -> bool:
+        if not force and isCoinListRecent(self.all_id_path, self.refreshInterval):
+            lib.printOk(f'Coin list has been fetched less than {self.refreshInterval} seconds ago')
+            return False
+        try:
+            old = self.getSymbolIndex()
+        except (OSError, ValueError, KeyError): # first download
+            old = dict()
+
+        try:
+            new = fetchCoinList(
+                'cmc', self.baseurl+'cryptocurrency/map', self.all_id_path, self.headers, self.timeout,
+                lambda crypto: {key: crypto.get(key) for key in ['id', 'symbol', 'name', 'rank', 'is_active']},
+                self.buildIndex, # coin list changed, rebuild the index
+                key='data'
+            )
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            # keep using the old coin list
+            lib.printFail(f'Error fetching coin list, {type(e).__name__} {e}')
+            return False
+        if new is None: return False
+        self.mergeIndex(old, new)
+        return True
+
+    # forget cached ids that are not in the new index anymore, see cg_api_n.mergeIndex()
+    def mergeIndex(self, old: dict[str, list[str]], new: dict[str, list[str]]) -> None:
+        added, removed, changed = diffIndex(old, new)
+        lib.printOk(f'Coin list: {len(added)} new symbol(s), {len(removed)} removed, {len(changed)} changed')
+        stale = [symb for (symb, id) in self.cachedSymbol.items() if str(id) not in new.get(symb, [])]
+        for symb in stale:
+            del self.cachedSymbol[symb]
+
+    # build a symbol -> [ids] index from CMC map and save it in index_id_CMC.json
+    # the same symbol may be used by more than one id, 
+    # ids are sorted so the first one is always the preferred one:
+    # active first, then by CMC rank (unranked last), then by id
+    # @param data iterable of dict eg. [{'id': 1, 'symbol': 'BTC', 'rank': 1, 'is_active': 1}, ]
+    # @return dict eg. {'BTC': ['1', ], }
+    def buildIndex(self, data) -> dict[str, list[str]]:
+        def sortKey(crypto: dict):
+            rank = crypto.get('rank')
+            return (not crypto.get('is_active', 1), rank if rank else float('inf'), crypto['id'])
+
+        grouped = dict() # { symbol: [(sort key, id), ] }
+        for crypto in data:
+            grouped.setdefault(crypto['symbol'], []).append((sortKey(crypto), str(crypto['id'])))
+        index = {symbol: [id for (_, id) in sorted(ids)] for (symbol, ids) in grouped.items()}
+
+        lib.dumpCompactJson(self.index_path, index)
+        self.symbolIndex = index
+        return index
+
+    # return symbol index, load it only the first time it's needed
+    # index is rebuilt if it's missing, corrupted or older than all_id_CMC.json
+    def getSymbolIndex(self) -> dict[str, list[str]]:
+        if self.symbolIndex is not None:
+            return self.symbolIndex
+
+        if not lib.isFileOutdated(self.index_path, self.all_id_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    self.symbolIndex = json.loads(f.read())
+                return self.symbolIndex
+            except json.decoder.JSONDecodeError:
+                lib.printWarn(f'{self.index_path} is corrupted, rebuilding it...')
+
+        data = loadCoinList(self.all_id_path)
+        if data is None: return dict()
+        # files fetched by older versions keep the whole CMC response
+        return self.buildIndex(data['data'] if isinstance(data, dict) else data)
 
     # convert 'symbols' in CMC ids
     # @param symbols list of crypto tickers ["BTC", "ETH"]
     # @return dict eg. {"BTC": "1", }
     def convertSymbols2ID(self, symbols: list) -> dict:
         id = {}
+        toSearch = []
 
         # check if there are some cached symbol
-        for i, symb in enumerate(symbols):
+        for symb in symbols:
             if symb in self.cachedSymbol:
                 id[symb] = self.cachedSymbol[symb]
-                symbols.pop(i) # remove from searching list
-
-        if len(symbols) > 0: 
-            found = 0
-            data = json.loads(open('all_id_CMC.json', 'r').read())['data'] # once in a while run fetchID() to update it
-
-            # check for every symbol in data
-            for i in range(len(data)):
-                if data[i]['symbol'] in symbols:
-                    id[data[i]['symbol']] = str(data[i]['id'])
-                    found +=1
-                    symbols.pop(symbols.index(data[i]['symbol']))
-
-            if found > 0:
-                self.cachedSymbol.update(id)
-                self.updateUsedSymbol()
+            else: toSearch.append(symb)
+
+        if len(toSearch) > 0: 
+            found = {}
+            index = self.getSymbolIndex() # once in a while run fetchID() to update it
+            # unknown symbols may be new coins, refresh the coin list at most once every self.refreshInterval
+            unknown = [symb for symb in toSearch if symb not in index]
+            if len(unknown) > 0 and not isCoinListRecent(self.all_id_path, self.refreshInterval):
+                lib.printWarn(f'Symbol(s) {unknown} not found, refreshing coin list...')
+                if self.fetchID(force=True):
+                    index = self.getSymbolIndex()
+
+            for symb in toSearch:
+                if symb not in index: continue
+                found[symb] = index[symb][0] # first id is the preferred one, see buildIndex()
+                if len(index[symb]) > 1:
+                    lib.printWarn(f'CoinMarketCap, multiple ids has been found for symbol {lib.WARNING_YELLOW}"{symb}"{lib.ENDC}, using id {found[symb]}, to change it edit {self.cacheFile}')
+
+            if len(found) > 0:
+                id.update(found)
+                self.cachedSymbol.update(found)
                 
         return id
 
-    # update used_id_CMC.json
-    def updateUsedSymbol(self) -> None:
-        with open(self.cacheFile, 'w') as f:
-            f.write(json.dumps(self.cachedSymbol))
-
     # convert 'symbols' to CMC ids and retrieve their prices
     # @param symbols list of crypto tickers eg. ["BTC", "ETH"]
     # @return (dict, True) if all symbols are found eg. ({"BTC": 20102.0348, "ETH": 1483.31747 }, True), 
@@ -310,24 +919,37 @@ class cmc_api:
     #          data is complete http response body loaded in a dict
     def getPriceOf(self, symbols: list):
         path = 'cryptocurrency/quotes/latest'
-        convertedSymbol = self.convertSymbols2ID(symbols)
-        id = list(convertedSymbol.values())
+        with profiler.stage('resolve_ids'):
+            convertedSymbol = self.convertSymbols2ID(symbols)
 
         toReturn = {}        
+        data = {}
 
-        parameters = {
-            'id': ','.join(id),
-            'convert': self.currency
-        }
+        # use cached prices if they are recent enough, see quoteCache
+        cache = getQuoteCache()
+        for symb, id in convertedSymbol.items():
+            price = cache.get('cmc', id, self.currency)
+            if price is not None: toReturn[symb] = price
+        toRequest = {symb: id for (symb, id) in convertedSymbol.items() if symb not in toReturn}
 
-        try:
-            response = self.session.get(self.baseurl+path, params=parameters)
-            data = json.loads(response.text)
-            for symb, id in convertedSymbol.items():
-                toReturn[symb] = data['data'][id]["quote"][self.currency]["price"] # store only price
+        if len(toRequest) > 0:
+            parameters = {
+                'id': ','.join(toRequest.values()),
+                'convert': self.currency
+            }
 
-        except (ConnectionError, Timeout, TooManyRedirects):
-            data = json.loads(response.text)
+            try:
+                with profiler.stage('quote_request'):
+                    response = getRateLimiter('cmc').request(lambda: getHttpClient().get(self.baseurl+path, params=parameters, headers=self.headers, timeout=self.timeout))
+                data = json.loads(response.text)
+                for symb, id in toRequest.items():
+                    toReturn[symb] = data['data'][id]["quote"][self.currency]["price"] # store only price
+                    cache.set('cmc', id, self.currency, toReturn[symb])
+
+            except (ConnectionError, Timeout, TooManyRedirects, rateLimitError) as e:
+                lib.printFail(f'CoinMarketCap error, {e}')
+                data = {} # no response to load
+            cache.dump()
         
         # if one or more symbols are not found for any kind of problem 
         # return also the missing one(s) and data
@@ -336,23 +958,116 @@ class cmc_api:
         
         return (toReturn, True)
 
-# retrieve price of 'symbol'
+YAHOO_BASEURL = 'https://query1.finance.yahoo.com/'
+
+# retrieve price of 'symbol' from yahoo chart api
 # @param symbol string eg. "EURUSD=X"
-# @return float, False if symbol cannot be found
-def yahooGetPriceOf(symbol: str):
+# @param timeout seconds to wait for each step of the request (connect, read)
+# @return float, False if symbol cannot be found or yahoo do not answer in time
+def yahooGetPriceOf(symbol: str, timeout: float = 15):
+    # use cached price if it's recent enough, see quoteCache
+    cache = getQuoteCache()
+    price = cache.get('yahoo', symbol, '')
+    if price is not None: return price
+
     try:
-        data = yf.download(tickers = symbol, period ='1d', interval = '1m', progress=False)
-        return data.tail()['Close'][4]
-    except web._utils.RemoteDataError: 
+        with profiler.stage('yahoo_fx'):
+            res = getRateLimiter('yahoo').request(lambda: getHttpClient().get(
+                f'{YAHOO_BASEURL}v8/finance/chart/{symbol}', 
+                params={'range': '1d', 'interval': '1d'},
+                headers={'User-Agent': 'Mozilla/5.0'}, # yahoo reject requests without it
+                timeout=timeout
+            ))
+        price = float(res.json()['chart']['result'][0]['meta']['regularMarketPrice'])
+        cache.set('yahoo', symbol, '', price)
+        cache.dump()
+        return price
+    except (requests.RequestException, KeyError, IndexError, TypeError, ValueError): 
         # if symbol cannot be found
         lib.printFail(f'Error getting price of {symbol}')
         return False
 
+# retrieve daily close prices of 'symbol' between start and end from yahoo chart api
+# all days are downloaded with one request
+# @param symbol string eg. "EURUSD=X"
+# @param start, end first and last day
+# @return dict eg. {'2023-01-31': 1.08, }, empty dict if symbol cannot be found
+def yahooGetHistoryOf(symbol: str, start: date, end: date, timeout: float = 15) -> dict[str, float]:
+    try:
+        with profiler.stage('yahoo_history'):
+            res = getRateLimiter('yahoo').request(lambda: getHttpClient().get(
+                f'{YAHOO_BASEURL}v8/finance/chart/{symbol}', 
+                params={
+                    'period1': int(datetime.combine(start, datetime.min.time(), timezone.utc).timestamp()),
+                    'period2': int(datetime.combine(end+timedelta(days=1), datetime.min.time(), timezone.utc).timestamp()),
+                    'interval': '1d'
+                },
+                headers={'User-Agent': 'Mozilla/5.0'}, # yahoo reject requests without it
+                timeout=timeout
+            ))
+        result = res.json()['chart']['result'][0]
+        closes = result['indicators']['quote'][0]['close']
+        return {
+            datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d'): close
+            for (ts, close) in zip(result['timestamp'], closes) if close is not None
+        }
+    except (requests.RequestException, KeyError, IndexError, TypeError, ValueError):
+        lib.printFail(f'Error getting history of {symbol}')
+        return dict()
+
+# retrieve daily close prices of 'symbol' between start and end
+# prices are cached in cached_fx_history.json, yahoo is asked only
+# for the days before and after the cached range, with one request for each side
+# today is never considered cached, its close price is not final yet
+# so records of today request only today's rate
+# @return dict eg. {'2023-01-31': 1.08, }, empty dict if symbol cannot be found
+def getFxHistory(symbol: str, start: date, end: date, timeout: float = 15, file: str = 'cached_fx_history.json') -> dict[str, float]:
+    try:
+        with open(file, 'r') as f:
+            # { symbol: {'from': 'yyyy-mm-dd', 'to': 'yyyy-mm-dd', 'rates': {'yyyy-mm-dd': rate, }} }
+            cache = json.loads(f.read())
+    except (OSError, json.decoder.JSONDecodeError):
+        cache = dict()
+
+    cached = cache.get(symbol)
+    if cached is not None and cached['from'] <= start.isoformat() and end.isoformat() <= cached['to']:
+        return cached['rates']
+
+    yesterday = date.today()-timedelta(days=1)
+    if cached is None:
+        rates = yahooGetHistoryOf(symbol, start, end, timeout)
+        if len(rates) == 0: return dict()
+        cached = {'from': start.isoformat(), 'to': min(end, yesterday).isoformat(), 'rates': rates}
+    else:
+        # the cached range is extended only on the sides that have been downloaded
+        # so it's always one continuous range
+        cachedFrom = date.fromisoformat(cached['from'])
+        cachedTo = date.fromisoformat(cached['to'])
+        isChanged = False
+        if start < cachedFrom:
+            rates = yahooGetHistoryOf(symbol, start, cachedFrom-timedelta(days=1), timeout)
+            if len(rates) > 0:
+                cached['rates'].update(rates)
+                cached['from'] = start.isoformat()
+                isChanged = True
+        if end > cachedTo:
+            rates = yahooGetHistoryOf(symbol, cachedTo+timedelta(days=1), end, timeout)
+            if len(rates) > 0:
+                cached['rates'].update(rates)
+                cached['to'] = max(cachedTo, min(end, yesterday)).isoformat()
+                isChanged = True
+        if not isChanged: return cached['rates']
+
+    cache[symbol] = cached
+    lib.dumpJsonAtomic(file, cache)
+    return cached['rates']
+
 def getTicker(ticker: str, start: str, end: str) -> float:
     # start and end format: yyyy-mm-dd
     if lib.isValidDate(start, '%Y-%m-%d') and lib.isValidDate(end, '%Y-%m-%d'):
-        data = yf.Ticker(ticker)
-        return data.history(period='1mo', interval='1d')['Close'][0]
+        # first close of the last month
+        closes = yahooGetHistoryOf(ticker, date.today()-timedelta(days=30), date.today())
+        return closes[min(closes)] if len(closes) > 0 else 0
     else: 
         print('error')
         return 0
@@ -0,0 +1,101 @@
+from time import perf_counter, time
+from threading import Lock, current_thread
+import json
+import sys
+
+#
+# Lightweight instrumentation of a run, enabled with --profile
+#   with profiler.stage('load_csv'):       wall time of a stage
+#   profiler.count('http.requests')         counters eg. requests, bytes, cache hits, retries
+# when profiler is disabled stage() returns a shared no-op context manager
+# and count() returns immediately, so instrumented code costs almost nothing
+# the trace is written as json at exit, see getTrace() for its format
+#
+class _noStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> bool:
+        return False
+
+class _stage:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *args) -> bool:
+        profiler.addStage(self.name, self.start, perf_counter())
+        return False
+
+class profiler:
+    enabled = False
+    NO_STAGE = _noStage()
+    lock = Lock() # stages and counters are recorded by concurrent requests too
+    startedAt = 0.0
+    stages = []
+    counters = dict()
+
+    # start recording, the trace is written in file at exit
+    @staticmethod
+    def enable(file: str) -> None:
+        import atexit
+        profiler.enabled = True
+        profiler.startedAt = perf_counter()
+        profiler.stages = []
+        profiler.counters = dict()
+        atexit.register(profiler.dump, file)
+
+    # @return context manager that records wall time of the code inside it
+    @staticmethod
+    def stage(name: str):
+        return _stage(name) if profiler.enabled else profiler.NO_STAGE
+
+    @staticmethod
+    def count(name: str, n: float = 1) -> None:
+        if not profiler.enabled: return
+        with profiler.lock:
+            profiler.counters[name] = profiler.counters.get(name, 0) + n
+
+    @staticmethod
+    def addStage(name: str, start: float, end: float) -> None:
+        with profiler.lock:
+            profiler.stages.append((name, start-profiler.startedAt, end-start, current_thread().name))
+
+    # @return dict eg.
+    #   {"command": "--calc --crypto", "total_s": 1.52,
+    #    "stages": [{"name": "load_csv", "start_s": 0.01, "duration_s": 0.04, "thread": "MainThread"}, ],
+    #    "stage_totals": {"load_csv": {"calls": 1, "total_s": 0.04}, },
+    #    "counters": {"http.requests": 2, "http.bytes": 5120, "quote_cache.miss": 3, }}
+    #   start_s is relative to the start of the run, stages may be nested or run in parallel
+    @staticmethod
+    def getTrace() -> dict:
+        with profiler.lock:
+            totals = dict()
+            for (name, _, duration, _) in profiler.stages:
+                total = totals.setdefault(name, {'calls': 0, 'total_s': 0.0})
+                total['calls'] += 1
+                total['total_s'] += duration
+            return {
+                'command': ' '.join(sys.argv[1:]),
+                'created_at': time(),
+                'total_s': round(perf_counter()-profiler.startedAt, 6),
+                'stages': [
+                    {'name': name, 'start_s': round(start, 6), 'duration_s': round(duration, 6), 'thread': thread}
+                    for (name, start, duration, thread) in sorted(profiler.stages, key=lambda stage: stage[1])
+                ],
+                'stage_totals': {name: {'calls': total['calls'], 'total_s': round(total['total_s'], 6)} for (name, total) in totals.items()},
+                'counters': {name: round(value, 6) for (name, value) in profiler.counters.items()},
+            }
+
+    @staticmethod
+    def dump(file: str) -> None:
+        with open(file, 'w') as f:
+            f.write(json.dumps(profiler.getTrace(), indent=4))
+        from lib_tool import lib
+        lib.printOk(f'Profile trace saved in {file}')
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,7 @@
+from os import path
+import sys
+
+# modules of the project are flat in the root folder, the mock server is in benchmark
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, path.join(ROOT, 'benchmark'))
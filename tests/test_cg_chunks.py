@@ -0,0 +1,52 @@
+from mock_server import mockServer, getPrice
+from math import ceil, log2
+import pytest
+import new_api
+
+#
+# CoinGecko price requests split in chunks, against the local mock server
+#
+
+@pytest.fixture
+def server(monkeypatch):
+    server = mockServer(coins=1000)
+    new_api.setHttpClient(new_api.httpClient(timeout=5))
+    # no pacing, the mock server has no rate limit
+    monkeypatch.setitem(new_api._rateLimiters, 'cg', new_api.rateLimiter('CoinGecko', rate=600000))
+    yield server
+    new_api.setHttpClient(None)
+    server.stop()
+
+def newCG() -> new_api.cg_api_n:
+    cg = object.__new__(new_api.cg_api_n) # without downloading the coin list
+    cg.currency = 'eur'
+    cg.timeout = 5
+    return cg
+
+def test_chunks_fit_limits():
+    cg = newCG()
+    ids = [f'coin-{i}' for i in range(1000)]
+    chunks = cg.chunkIds(ids, 100)
+    assert sum(chunks, []) == ids
+    assert all(len(chunk) <= new_api.cg_api_n.MAX_IDS_PER_REQUEST for chunk in chunks)
+    assert all(100+sum(len(id)+3 for id in chunk) <= new_api.cg_api_n.MAX_URL_LENGTH for chunk in chunks)
+
+def test_bad_id_is_isolated(server):
+    cg = newCG()
+    ids = [f'coin-{i}' for i in range(600)]
+    ids.insert(300, 'coin-bad')
+    res = cg.requestPrices(server.getBaseUrls()['cg']+'simple/price', ids)
+
+    assert len(res) == 600
+    assert 'coin-bad' not in res
+    assert all(res[f'coin-{i}'] == {'eur': getPrice(i)} for i in range(600))
+    # one request per chunk, plus two for each halving of the chunk with the bad id
+    chunks = len(cg.chunkIds(ids, 0))
+    assert server.requests <= chunks + 2*ceil(log2(new_api.cg_api_n.MAX_IDS_PER_REQUEST))
+
+def test_no_split_without_bad_ids(server):
+    cg = newCG()
+    ids = [f'coin-{i}' for i in range(600)]
+    res = cg.requestPrices(server.getBaseUrls()['cg']+'simple/price', ids)
+    assert len(res) == 600
+    assert server.requests == len(cg.chunkIds(ids, 0))
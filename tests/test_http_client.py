@@ -0,0 +1,91 @@
+from requests.adapters import BaseAdapter, HTTPAdapter
+from mock_server import mockServer
+import requests
+import pytest
+import new_api
+
+#
+# httpClient with a transport injected through setHttpClient()
+#
+
+# real transport that records the timeout of each request
+class recordingAdapter(HTTPAdapter):
+    def __init__(self) -> None:
+        super().__init__(pool_connections=1, pool_maxsize=1, pool_block=True)
+        self.timeouts = []
+
+    def send(self, request, **kwargs):
+        self.timeouts.append(kwargs.get('timeout'))
+        return super().send(request, **kwargs)
+
+# fake transport that answers with the given status codes, one per request
+class statusAdapter(BaseAdapter):
+    def __init__(self, statuses: list[int]) -> None:
+        super().__init__()
+        self.statuses = statuses
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        res = requests.Response()
+        res.status_code = self.statuses[min(self.calls, len(self.statuses)-1)]
+        res._content = b'{}'
+        res.request = request
+        res.url = request.url
+        self.calls += 1
+        return res
+
+    def close(self) -> None:
+        pass
+
+@pytest.fixture
+def server():
+    server = mockServer(coins=10)
+    yield server
+    server.stop()
+
+@pytest.fixture(autouse=True)
+def resetHttpClient():
+    yield
+    new_api.setHttpClient(None)
+
+def test_connections_are_reused(server):
+    adapter = recordingAdapter()
+    new_api.setHttpClient(new_api.httpClient(timeout=7, adapter=adapter))
+    for i in range(5):
+        res = new_api.getHttpClient().get(server.url+'api/v3/simple/price', params={'ids': f'coin-{i}', 'vs_currencies': 'eur'})
+        assert res.status_code == 200
+
+    assert server.requests == 5
+    assert server.connections == 1
+
+def test_timeouts(server):
+    adapter = recordingAdapter()
+    new_api.setHttpClient(new_api.httpClient(timeout=7, adapter=adapter))
+    new_api.getHttpClient().get(server.url+'api/v3/coins/list')
+    new_api.getHttpClient().get(server.url+'api/v3/coins/list', timeout=2)
+    # (connect, read), connect timeout is at most CONNECT_TIMEOUT
+    assert adapter.timeouts == [(new_api.httpClient.CONNECT_TIMEOUT, 7), (2, 2)]
+
+def test_server_errors_are_retried():
+    adapter = statusAdapter([503, 429, 200])
+    new_api.setHttpClient(new_api.httpClient(adapter=adapter))
+    limiter = new_api.rateLimiter('test', rate=60000, baseDelay=0.01)
+    res = limiter.request(lambda: new_api.getHttpClient().get('http://mock/'))
+    assert res.status_code == 200
+    assert adapter.calls == 3
+    assert limiter.getStats()['retries'] == 2
+
+def test_retries_give_up():
+    adapter = statusAdapter([503])
+    new_api.setHttpClient(new_api.httpClient(adapter=adapter))
+    limiter = new_api.rateLimiter('test', rate=60000, maxRetries=2, baseDelay=0.01)
+    with pytest.raises(new_api.rateLimitError):
+        limiter.request(lambda: new_api.getHttpClient().get('http://mock/'))
+    assert adapter.calls == 3
+
+def test_client_errors_are_not_retried():
+    adapter = statusAdapter([404, 200])
+    new_api.setHttpClient(new_api.httpClient(adapter=adapter))
+    limiter = new_api.rateLimiter('test', rate=60000, baseDelay=0.01)
+    assert limiter.request(lambda: new_api.getHttpClient().get('http://mock/')).status_code == 404
+    assert adapter.calls == 1
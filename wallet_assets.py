@@ -0,0 +1,77 @@
+#
+# Assets of a wallet, indexed by symbol and by type
+#   symbol lookup, membership and type lookup are O(1)
+#   assets of each type are kept in their own dict, in insertion order
+#   total value of each type is updated on every change, so it's never recalculated
+# used by calculateWalletValue as self.wallet['asset']
+#
+class asset:
+    __slots__ = ('symbol', 'qta', 'value', 'type')
+
+    def __init__(self, symbol: str, qta: float, value: float, type: str) -> None:
+        self.symbol = symbol
+        self.qta = qta
+        self.value = value
+        self.type = type
+
+class walletAssets:
+    TYPES = ('crypto', 'stable', 'fiat')
+
+    def __init__(self) -> None:
+        self.assets = dict() # symbol -> asset
+        self.byType = {type: dict() for type in walletAssets.TYPES} # type -> {symbol: asset}
+        self.totals = {type: 0.0 for type in walletAssets.TYPES} # type -> sum of values
+
+    def __len__(self) -> int:
+        return len(self.assets)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.assets
+
+    def __getitem__(self, symbol: str) -> asset:
+        return self.assets[symbol]
+
+    # add an asset, if symbol is already in wallet only qta is added
+    def add(self, symbol: str, qta: float, value: float, type: str) -> None:
+        item = self.assets.get(symbol)
+        if item is not None:
+            item.qta += qta
+            return
+        item = asset(symbol, qta, value, type)
+        self.assets[symbol] = item
+        self.byType[type][symbol] = item
+        self.totals[type] += value
+
+    def setValue(self, symbol: str, value: float) -> None:
+        item = self.assets[symbol]
+        self.totals[item.type] += value - item.value
+        item.value = value
+
+    # @return sum of values of assets of the given types, see get() for typeOfAsset
+    def getTotal(self, typeOfAsset: list) -> float:
+        types = walletAssets.TYPES if 'all' in typeOfAsset else typeOfAsset
+        return sum(self.totals[type] for type in types if type in self.totals)
+
+    # get assets of the given types ('crypto' or 'stable' or 'fiat' or 'all')
+    # default return: list of symbol filtered by type
+    # pass fullItem=True to get a list of [symbol, qta, value, type]
+    # pass getQta or getValue to get a list of [symbol, ?qta, ?value]
+    # assets are returned in insertion order
+    def get(self, typeOfAsset: list, fullItem = False, getQta = False, getValue = False) -> list[list] | list[str]:
+        if 'all' in typeOfAsset:
+            items = self.assets.values()
+        else:
+            types = [type for type in walletAssets.TYPES if type in typeOfAsset]
+            if len(types) == 1:
+                items = self.byType[types[0]].values()
+            else:
+                items = [item for item in self.assets.values() if item.type in types]
+
+        if fullItem: return [[item.symbol, item.qta, item.value, item.type] for item in items]
+        elif getQta and getValue: return [[item.symbol, item.qta, item.value] for item in items]
+        elif getQta: return [[item.symbol, item.qta] for item in items]
+        elif getValue: return [[item.symbol, item.value] for item in items]
+        else: return [item.symbol for item in items]
+
+if __name__ == '__main__':
+    pass